@@ -0,0 +1,197 @@
+"""
+Headless pipeline benchmark: synthetic or WAV audio -> ring buffer -> FFT bands -> normalization -> render -> MIDI,
+with a recording mock Launchpad instead of the hardware.
+
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --signal drums --seconds 30 --budget-ms 2
+    python -m benchmarks.bench_pipeline --wav track.wav
+    python -m benchmarks.bench_pipeline --stereo
+    python -m benchmarks.bench_pipeline --fft-backend scipy --chunk-size 4096
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from core.config import CONFIG
+from core.fft import FFT_AUTO, FFT_BACKENDS, FFT_NUMPY, choose_fft
+from core.led_frame import SysExEncoder
+from core.midi_output import RtMidiWriter
+from core.onset import create_onset_detector
+from core.ring_buffer import AudioRingBuffer
+from core.spectrum import get_analyzer
+from core.state import NORMALIZER
+from core.devices import LaunchpadDevice
+from core.laucnhpad_visualization import visualize_audio_bands
+from main import process_audio_chunk, detect_beat, normalize_bands
+from benchmarks.mock_launchpad import MockLaunchpad
+from benchmarks.signals import SIGNALS, wav_file
+
+STAGES = ("capture", "fft", "onset", "normalize", "render", "midi", "total")
+PERCENTILES = (50, 95, 99)
+
+
+class RecordingOutput:
+    """ MidiOutputWorker stand-in: writes every frame diff right away, so every frame is measured """
+
+    def __init__(self, lp: MockLaunchpad):
+        self.lp = lp
+        # the raw messages go to the mock port as they would go to rtmidi
+        self.writer = RtMidiWriter(lp.midi, "mock")
+        self.encoder = SysExEncoder()
+        self.last_ns = 0
+        self.last_leds = 0
+        self.last_messages = 0
+        self.last_diff = {}
+
+    def submit(self, leds: dict, timestamp: int | None = None):
+        self.last_diff = leds
+        start = time.perf_counter_ns()
+        self.last_messages = self.writer.send(self.encoder.encode(leds)) if leds else 0
+        self.last_leds = len(leds)
+        self.last_ns = time.perf_counter_ns() - start
+
+    def reset(self):
+        self.lp.Reset()
+
+
+def reset_pipeline():
+    """ fresh normalizer state, so every signal starts from the same point """
+    NORMALIZER.reset()
+
+
+def create_analyzer(chunk_size: int, stereo: bool = False, fft_backend: str = FFT_NUMPY):
+    return get_analyzer(
+        CONFIG.audio.SAMPLERATE, chunk_size, CONFIG.bands.RANGE, CONFIG.audio.CHANNELS, CONFIG.bands.TRIANGULAR,
+        CONFIG.bands.SCALE, stereo, fft_backend, CONFIG.analysis.FFT_WORKERS)
+
+
+def run(
+        audio: np.ndarray, chunk_size: int, hop_size: int, write_delay: float = 0.0, stereo: bool = False,
+        fft_backend: str = FFT_NUMPY) -> dict:
+    """ runs the audio through the pipeline, returns per frame stage timings (ns) and MIDI counters """
+    channels = CONFIG.audio.CHANNELS
+    analyzer = create_analyzer(chunk_size, stereo, fft_backend)
+    onsets = create_onset_detector(analyzer, hop_size)
+    ring = AudioRingBuffer(chunk_size, channels, hop_size)
+    lp = MockLaunchpad(write_delay)
+    output = RecordingOutput(lp)
+    devices = [LaunchpadDevice(output, name="mock")]
+    reset_pipeline()
+
+    source = memoryview(audio.tobytes())
+    hop_bytes = ring.hop_bytes
+    frames = (len(source) - ring.window_bytes) // hop_bytes + 1
+    timings = {stage: np.zeros(frames, dtype=np.int64) for stage in STAGES}
+    leds = np.zeros(frames, dtype=np.int64)
+    messages = np.zeros(frames, dtype=np.int64)
+    beats = 0
+
+    position = 0
+    frame = 0
+    while frame < frames:
+        t0 = time.perf_counter_ns()
+        # simulated pipe reads of one hop
+        window = ring.read_window()
+        while window is None:
+            writable = ring.writable()
+            nbytes = min(hop_bytes, len(writable), len(source) - position)
+            writable[:nbytes] = source[position:position + nbytes]
+            ring.commit(nbytes)
+            position += nbytes
+            window = ring.read_window()
+        t1 = time.perf_counter_ns()
+        bands_rms = process_audio_chunk(window, analyzer)
+        balance = analyzer.balance() if stereo else None
+        t2 = time.perf_counter_ns()
+        beat = detect_beat(onsets)
+        t3 = time.perf_counter_ns()
+        normalized = normalize_bands(bands_rms)
+        t4 = time.perf_counter_ns()
+        visualize_audio_bands(devices, normalized, beat=beat, balance=balance)
+        t5 = time.perf_counter_ns()
+
+        timings["capture"][frame] = t1 - t0
+        timings["fft"][frame] = t2 - t1
+        timings["onset"][frame] = t3 - t2
+        timings["normalize"][frame] = t4 - t3
+        timings["render"][frame] = t5 - t4 - output.last_ns
+        timings["midi"][frame] = output.last_ns
+        timings["total"][frame] = t5 - t0
+        leds[frame] = output.last_leds
+        messages[frame] = output.last_messages
+        beats += beat
+        frame += 1
+
+    return {
+        "timings": timings,
+        "leds": leds,
+        "messages": messages,
+        "midi_bytes": lp.midi.bytes,
+        "beats": beats,
+        "bpm": onsets.bpm if onsets is not None else 0.0,
+        "audio_seconds": len(audio) / channels / CONFIG.audio.SAMPLERATE,
+    }
+
+
+def report(name: str, result: dict) -> float:
+    """ prints the summary, returns the total p99 (ms) """
+    timings = result["timings"]
+    frames = len(timings["total"])
+    processing_seconds = timings["total"].sum() / 1e9
+
+    print(f"\n== {name}: {frames} frames, {result['audio_seconds']:.1f} s of audio")
+    print(f"frames/sec: {frames / processing_seconds:,.0f}  realtime factor: {result['audio_seconds'] / processing_seconds:,.1f}x")
+    print(f"{'stage':<10}" + "".join(f"{f'p{p} us':>11}" for p in PERCENTILES) + f"{'max us':>11}")
+    for stage in STAGES:
+        values = timings[stage] / 1e3
+        row = "".join(f"{v:>11.1f}" for v in np.percentile(values, PERCENTILES))
+        print(f"{stage:<10}{row}{values.max():>11.1f}")
+
+    print(
+        f"MIDI per frame: {result['messages'].mean():.2f} messages (max {result['messages'].max()}), "
+        f"{result['leds'].mean():.1f} LEDs (max {result['leds'].max()}), "
+        f"{result['midi_bytes'] / frames:.0f} bytes"
+    )
+    print(f"beats: {result['beats']}, tempo: {result['bpm']:.1f} BPM")
+    return np.percentile(timings["total"], 99) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless pipeline benchmark")
+    parser.add_argument("-s", "--signal", choices=[*SIGNALS, "all"], default="all", help="Synthetic signal")
+    parser.add_argument("-w", "--wav", help="Audio file instead of the synthetic signals")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Synthetic signal length")
+    parser.add_argument("--chunk-size", type=int, default=CONFIG.audio.CHUNK_SIZE)
+    parser.add_argument("--hop-size", type=int, default=CONFIG.audio.HOP_SIZE)
+    parser.add_argument("--write-delay-ms", type=float, default=0.0, help="Simulated time per MIDI write")
+    parser.add_argument("--stereo", action="store_true", help="Per channel analysis (one batched FFT over both channels)")
+    parser.add_argument("--fft-backend", choices=[FFT_AUTO, *FFT_BACKENDS], default=CONFIG.analysis.FFT_BACKEND, help="FFT backend, auto - the fastest installed one")
+    parser.add_argument("--budget-ms", type=float, help="Exit with code 1 if the total p99 exceeds it")
+    args = parser.parse_args()
+
+    samplerate = CONFIG.audio.SAMPLERATE
+    channels = CONFIG.audio.CHANNELS
+    if args.wav:
+        sources = {args.wav: wav_file(args.wav, samplerate, channels)}
+    else:
+        names = SIGNALS if args.signal == "all" else [args.signal]
+        sources = {name: SIGNALS[name](args.seconds, samplerate, channels) for name in names}
+
+    stereo = args.stereo and channels == 2
+    fft_backend, _ = choose_fft(
+        lambda backend, size: create_analyzer(size, stereo, backend), args.fft_backend, [], args.chunk_size, 0.0)
+    print(
+        f"chunk size: {args.chunk_size}, hop size: {args.hop_size}, samplerate: {samplerate}, channels: {channels}, "
+        f"FFT: {fft_backend}")
+    worst_p99 = 0.0
+    for name, audio in sources.items():
+        result = run(audio, args.chunk_size, args.hop_size, args.write_delay_ms / 1e3, stereo, fft_backend)
+        worst_p99 = max(worst_p99, report(name, result))
+
+    if args.budget_ms is not None and worst_p99 > args.budget_ms:
+        print(f"\nFAILED: total p99 {worst_p99:.3f} ms > budget {args.budget_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
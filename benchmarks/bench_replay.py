@@ -0,0 +1,78 @@
+"""
+Render and MIDI stages benchmark on a recording (`python main.py --record DIR`): the recorded band frames
+go through `visualize_audio_bands` into mock Launchpads, the produced LED diffs are checked against the recorded ones.
+
+    python -m benchmarks.bench_replay recordings/show
+    python -m benchmarks.bench_replay recordings/show --realtime --write-delay-ms 0.3
+"""
+import argparse
+import sys
+import numpy as np
+from core.devices import LaunchpadDevice, assign_layout, LAYOUT_MIRROR
+from core.recording import Recording, replay
+from benchmarks.bench_pipeline import PERCENTILES, RecordingOutput, reset_pipeline
+from benchmarks.mock_launchpad import MockLaunchpad
+
+
+def run(recording: Recording, realtime: bool = False, write_delay: float = 0.0) -> dict:
+    """ replays the recording on mock devices, returns per frame render/MIDI timings (ns) and the diff mismatches """
+    outputs = [RecordingOutput(MockLaunchpad(write_delay)) for _ in range(recording.meta.get("devices_count", 1))]
+    devices = [LaunchpadDevice(output, name=f"mock {i}") for i, output in enumerate(outputs)]
+    assign_layout(devices, recording.bands_count, recording.meta.get("layout", LAYOUT_MIRROR))
+    reset_pipeline()
+
+    frames = len(recording)
+    timings = {stage: np.zeros(frames, dtype=np.int64) for stage in ("render", "midi")}
+    mismatches = []
+
+    def on_frame(index: int, render_ns: int):
+        midi_ns = sum(output.last_ns for output in outputs)
+        timings["render"][index] = render_ns - midi_ns
+        timings["midi"][index] = midi_ns
+        for device, output in enumerate(outputs):
+            if output.last_diff != recording.frame_leds(index, device):
+                mismatches.append((index, device))
+
+    replay(recording, devices, realtime, on_frame)
+    return {
+        "timings": timings,
+        "mismatches": mismatches,
+        "messages": sum(output.lp.midi.messages for output in outputs),
+        "midi_bytes": sum(output.lp.midi.bytes for output in outputs),
+    }
+
+
+def report(recording: Recording, result: dict):
+    timings = result["timings"]
+    frames = len(recording)
+    print(f"{recording.path}: {frames} frames, {recording.duration:.1f} s, {recording.meta.get('devices_count', 1)} device(s)")
+    print(f"{'stage':<10}" + "".join(f"{f'p{p} us':>11}" for p in PERCENTILES) + f"{'max us':>11}")
+    for stage, values in timings.items():
+        values = values / 1e3
+        row = "".join(f"{v:>11.1f}" for v in np.percentile(values, PERCENTILES))
+        print(f"{stage:<10}{row}{values.max():>11.1f}")
+    print(f"MIDI: {result['messages']} messages, {result['midi_bytes'] / max(frames, 1):.0f} bytes per frame")
+    print(f"LED diffs different from the recording: {len(result['mismatches'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render/MIDI benchmark on a recording")
+    parser.add_argument("recording", help="Recording directory")
+    parser.add_argument("--realtime", action="store_true", help="Replay at the recorded pace instead of max speed")
+    parser.add_argument("--write-delay-ms", type=float, default=0.0, help="Simulated time per MIDI write")
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    if not len(recording):
+        print(f"{args.recording} has no frames")
+        sys.exit(1)
+
+    result = run(recording, args.realtime, args.write_delay_ms / 1e3)
+    report(recording, result)
+    # the render is deterministic, a different diff means the renderer changed since the recording
+    if result["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import time
+
+
+class MockMidi:
+    """ records what launchpad_py (or rtmidi) would write to the MIDI output """
+
+    def __init__(self, write_delay: float = 0.0):
+        # simulated time per MIDI write (seconds), 0 -> no delay
+        self.write_delay = write_delay
+        self.sysex = []
+        self.messages = 0
+        self.bytes = 0
+
+    def RawWriteSysEx(self, lstMessage, timeStamp=0):
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        self.sysex.append(lstMessage)
+        self.messages += 1
+        # + F0 and F7
+        self.bytes += len(lstMessage) + 2
+
+    def send_message(self, message):
+        """ python-rtmidi MidiOut.send_message, a complete message (F0 ... F7) """
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        self.sysex.append(list(message[1:-1]))
+        self.messages += 1
+        self.bytes += len(message)
+
+    def close_port(self):
+        pass
+
+    def clear(self):
+        self.sysex.clear()
+        self.messages = 0
+        self.bytes = 0
+
+
+class MockLaunchpad:
+    """ Launchpad Pro stand-in for running the pipeline without the hardware """
+
+    def __init__(self, write_delay: float = 0.0):
+        self.midi = MockMidi(write_delay)
+        self.resets = 0
+
+    def Open(self, number=0, name="Pro"):
+        return True
+
+    def Close(self):
+        pass
+
+    def Reset(self):
+        self.resets += 1
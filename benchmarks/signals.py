@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def sine_sweep(seconds: float, samplerate: int, channels: int = 2, f_start: float = 20.0, f_end: float = 20000.0) -> np.ndarray:
+    """ logarithmic sine sweep f_start -> f_end, interleaved float32 """
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    k = np.log(f_end / f_start)
+    phase = 2 * np.pi * f_start * seconds / k * (np.exp(t / seconds * k) - 1)
+    return _interleave(0.5 * np.sin(phase), channels)
+
+
+def pink_noise(seconds: float, samplerate: int, channels: int = 2, seed: int = 0) -> np.ndarray:
+    """ 1/f noise (white noise shaped in the frequency domain), interleaved float32 """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * samplerate)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freqs = np.arange(len(spectrum))
+    spectrum[1:] /= np.sqrt(freqs[1:])
+    spectrum[0] = 0
+    noise = np.fft.irfft(spectrum, n)
+    return _interleave(0.5 * noise / np.max(np.abs(noise)), channels)
+
+
+def drum_loop(seconds: float, samplerate: int, channels: int = 2, bpm: float = 120.0, seed: int = 0) -> np.ndarray:
+    """ kicks on every beat, hats on the offbeats, a bit of bass, interleaved float32 """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * samplerate)
+    signal = np.zeros(n)
+    beat = int(60.0 / bpm * samplerate)
+
+    kick_t = np.arange(int(0.25 * samplerate)) / samplerate
+    kick = np.sin(2 * np.pi * (50 * kick_t + 60 * (1 - np.exp(-kick_t * 30)) / 30)) * np.exp(-kick_t * 12)
+
+    hat_len = int(0.05 * samplerate)
+    hat = np.diff(rng.standard_normal(hat_len + 1)) * np.exp(-np.arange(hat_len) / samplerate * 80) * 0.2
+
+    for start in range(0, n, beat):
+        end = min(start + len(kick), n)
+        signal[start:end] += kick[:end - start]
+        hat_start = start + beat // 2
+        if hat_start < n:
+            end = min(hat_start + hat_len, n)
+            signal[hat_start:end] += hat[:end - hat_start]
+
+    t = np.arange(n) / samplerate
+    signal += 0.1 * np.sin(2 * np.pi * 55 * t)
+    return _interleave(0.5 * signal / np.max(np.abs(signal)), channels)
+
+
+def wav_file(path: str, samplerate: int, channels: int = 2) -> np.ndarray:
+    """ audio file (anything soundfile reads) as interleaved float32 with the requested channels """
+    import soundfile
+
+    data, file_samplerate = soundfile.read(path, dtype="float32", always_2d=True)
+    if file_samplerate != samplerate:
+        raise ValueError(f"{path} samplerate is {file_samplerate}, the pipeline expects {samplerate}")
+
+    if data.shape[1] != channels:
+        data = np.repeat(data.mean(axis=1, keepdims=True), channels, axis=1)
+    return np.ascontiguousarray(data, dtype=np.float32).ravel()
+
+
+def _interleave(mono: np.ndarray, channels: int) -> np.ndarray:
+    return np.repeat(mono.astype(np.float32), channels)
+
+
+SIGNALS = {
+    "sweep": sine_sweep,
+    "pink": pink_noise,
+    "drums": drum_loop,
+}
@@ -0,0 +1,290 @@
+import asyncio
+import multiprocessing
+import struct
+import time
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from core.config import CONFIG
+from core.config_watcher import apply_sections
+from core.fft import FFT_NUMPY, choose_fft
+from core.onset import create_onset_detector
+from core.spectrum import get_analyzer
+from core.state import configure_normalizer
+from utils.logger import logger
+
+# the config sections the worker stages depend on
+_WORKER_SECTIONS = ("bands", "beat", "ema", "threshold")
+
+# main -> worker: one byte, the slot index or a command
+_RESET = 0xFF
+_STOP = 0xFE
+_RELOAD = 0xFD  # followed by the pickled {name: section} the main process applied
+# worker -> main: slot, silence, beat, fft ns, onset ns, normalize ns, left/right balance
+_RESULT = struct.Struct("<B??qqqdd")
+
+AUDIO_DTYPE = np.float32
+BANDS_DTYPE = np.float64
+
+
+class AnalysisStages:
+    """
+    Spectrum analyzer and onset detector (None when off) of one stream,
+    rebuilt from the current config when the bands or the beat settings change.
+    """
+
+    def __init__(self, chunk_size: int, hop_size: int, fft_backend: str = FFT_NUMPY):
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size
+        self.fft_backend = fft_backend
+        self.build()
+
+    def build(self):
+        # window, bins, the filterbank matrix and the FFT plan are built once per bands config
+        self.analyzer = _create_analyzer(self.fft_backend, self.chunk_size)
+        self.onsets = create_onset_detector(self.analyzer, self.hop_size)
+
+    @property
+    def stereo(self) -> bool:
+        return CONFIG.analysis.STEREO and CONFIG.audio.CHANNELS == 2
+
+    def balance(self) -> tuple[float, float] | None:
+        """ left/right shares of the last window (stereo analysis), None -> mono """
+        return self.analyzer.balance() if self.stereo else None
+
+    def reset(self):
+        if self.onsets is not None:
+            self.onsets.reset()
+
+    def reconfigure(self, changed: list[str]):
+        """ applies the reloaded config sections, the normalizer keeps its EMA state """
+        if "bands" in changed or "beat" in changed:
+            self.build()
+        if {"bands", "ema", "threshold"} & set(changed):
+            configure_normalizer()
+
+
+def _create_analyzer(fft_backend: str, chunk_size: int):
+    return get_analyzer(
+        CONFIG.audio.SAMPLERATE, chunk_size, CONFIG.bands.RANGE, CONFIG.audio.CHANNELS,
+        CONFIG.bands.TRIANGULAR, CONFIG.bands.SCALE, CONFIG.analysis.STEREO and CONFIG.audio.CHANNELS == 2,
+        fft_backend, CONFIG.analysis.FFT_WORKERS)
+
+
+def choose_analysis_fft(hop_size: int) -> tuple[str, int]:
+    """ FFT backend and window size (frames) from the startup benchmark of the AnalysisConfig.FFT_* candidates """
+    analysis = CONFIG.analysis
+    # the window can't be shorter than a hop
+    sizes = [size for size in analysis.FFT_SIZES if size >= hop_size]
+    budget = analysis.FFT_BUDGET * hop_size / CONFIG.audio.SAMPLERATE
+    return choose_fft(_create_analyzer, analysis.FFT_BACKEND, sizes, CONFIG.audio.CHUNK_SIZE, budget)
+
+
+class AnalysisResult:
+    """ one analyzed window, `bands` is a view over the shared slot and stays valid until the next `submit` """
+
+    __slots__ = ("bands", "timestamp", "beat", "fft_ns", "onset_ns", "normalize_ns", "balance")
+
+    def __init__(
+            self, bands: np.ndarray | None, timestamp: int | None, beat: bool,
+            fft_ns: int, onset_ns: int, normalize_ns: int, balance: tuple[float, float] | None = None):
+        # None -> silence (all the band RMS values are 0, nothing was normalized)
+        self.bands = bands
+        self.timestamp = timestamp
+        self.beat = beat
+        self.fft_ns = fft_ns
+        self.onset_ns = onset_ns
+        self.normalize_ns = normalize_ns
+        # left/right shares of the stereo analysis, None -> mono
+        self.balance = balance
+
+
+class AnalysisProcess:
+    """
+    Runs the FFT analysis and the bands normalization in a separate process.
+
+    The audio windows and the normalized bands go through `multiprocessing.shared_memory` slots,
+    only the slot index (one byte) and the timings go through the pipe, only a config reload is pickled.
+    Up to `slots` windows are in flight, the results come back in order.
+    The worker has its own config: on a config reload it gets the sections the main process applied (`reconfigure`).
+    """
+
+    def __init__(self, chunk_size: int, hop_size: int, slots: int = 4, fft_backend: str = FFT_NUMPY):
+        if not 0 < slots < _STOP:
+            raise ValueError(f"slots must be between 1 and {_STOP - 1}, got {slots}")
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size
+        self.slots = slots
+        self.fft_backend = fft_backend
+        self.chunk_samples = chunk_size * CONFIG.audio.CHANNELS
+        self.bands_count = len(CONFIG.bands.RANGE)
+
+        self.audio = None
+        self.bands = None
+        self._audio_shm = None
+        self._bands_shm = None
+        self._conn = None
+        self._process = None
+        self._free = deque()
+        self._in_flight = deque()
+        self._timestamps = [None] * slots
+
+    def start(self):
+        audio_size = self.slots * self.chunk_samples * np.dtype(AUDIO_DTYPE).itemsize
+        bands_size = self.slots * self.bands_count * np.dtype(BANDS_DTYPE).itemsize
+        self._audio_shm = SharedMemory(create=True, size=audio_size)
+        self._bands_shm = SharedMemory(create=True, size=bands_size)
+        self.audio = np.ndarray((self.slots, self.chunk_samples), dtype=AUDIO_DTYPE, buffer=self._audio_shm.buf)
+        self.bands = np.ndarray((self.slots, self.bands_count), dtype=BANDS_DTYPE, buffer=self._bands_shm.buf)
+
+        # spawn -> a clean interpreter, no copy of the event loop and the MIDI threads
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(
+                child_conn, self._audio_shm.name, self._bands_shm.name, self.chunk_size, self.hop_size, self.slots,
+                self.fft_backend),
+            name="analysis",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+        self._free = deque(range(self.slots))
+        self._in_flight.clear()
+        logger.info(f"Analysis process started (pid {self._process.pid}, {self.slots} slots).")
+
+    def stop(self, timeout: float = 1.0):
+        if self._process is not None:
+            try:
+                self._conn.send_bytes(bytes((_STOP,)))
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+            self._conn.close()
+
+        # the views must be gone before the shared memory is closed
+        self.audio = None
+        self.bands = None
+        for shm in (self._audio_shm, self._bands_shm):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._audio_shm = None
+        self._bands_shm = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def full(self) -> bool:
+        """ every slot is in flight, the next `submit` has to wait for a result """
+        return not self._free
+
+    def submit(self, window: np.ndarray, timestamp: int | None = None):
+        """ copies the window into a free slot and hands it to the worker """
+        if not self._free:
+            raise RuntimeError("No free analysis slot, wait for a result first")
+        slot = self._free.popleft()
+        np.copyto(self.audio[slot], window)
+        self._timestamps[slot] = timestamp
+        self._in_flight.append(slot)
+        self._conn.send_bytes(bytes((slot,)))
+
+    def ready(self) -> bool:
+        """ the oldest in flight window is analyzed """
+        return bool(self._in_flight) and self._conn.poll()
+
+    async def result(self) -> AnalysisResult:
+        """ result of the oldest in flight window, waits for it (off the event loop) if it is not ready yet """
+        if not self._in_flight:
+            raise RuntimeError("No window is in flight")
+        if self._conn.poll():
+            message = self._conn.recv_bytes()
+        else:
+            message = await asyncio.get_running_loop().run_in_executor(None, self._conn.recv_bytes)
+
+        slot, silent, beat, fft_ns, onset_ns, normalize_ns, left, right = _RESULT.unpack(message)
+        expected = self._in_flight.popleft()
+        if slot != expected:
+            raise RuntimeError(f"Analysis result for slot {slot}, expected {expected}")
+        self._free.append(slot)
+        return AnalysisResult(
+            None if silent else self.bands[slot], self._timestamps[slot], beat, fft_ns, onset_ns, normalize_ns,
+            (left, right) if CONFIG.analysis.STEREO and CONFIG.audio.CHANNELS == 2 else None)
+
+    async def discard(self) -> int:
+        """ waits for the windows in flight and drops their results, returns how many """
+        count = 0
+        while self._in_flight:
+            await self.result()
+            count += 1
+        return count
+
+    def reset(self):
+        """ resets the normalizer and onsets state of the worker (after the windows already submitted) """
+        self._conn.send_bytes(bytes((_RESET,)))
+
+    def reconfigure(self, changed: list[str]):
+        """ sends the applied sections to the worker, it rebuilds its stages (after the windows already submitted) """
+        sections = {name: getattr(CONFIG, name) for name in changed if name in _WORKER_SECTIONS}
+        if sections:
+            self._conn.send_bytes(bytes((_RELOAD,)))
+            self._conn.send(sections)
+
+
+def _worker_main(
+        conn, audio_name: str, bands_name: str, chunk_size: int, hop_size: int, slots: int, fft_backend: str):
+    # the worker has its own normalizer and onsets state (and FFT plans)
+    from core.state import NORMALIZER
+
+    stages = AnalysisStages(chunk_size, hop_size, fft_backend)
+    audio_shm = SharedMemory(name=audio_name)
+    bands_shm = SharedMemory(name=bands_name)
+    audio = np.ndarray((slots, chunk_size * CONFIG.audio.CHANNELS), dtype=AUDIO_DTYPE, buffer=audio_shm.buf)
+    bands = np.ndarray((slots, stages.analyzer.bands_count), dtype=BANDS_DTYPE, buffer=bands_shm.buf)
+
+    try:
+        while True:
+            try:
+                command = conn.recv_bytes()[0]
+            except EOFError:
+                break
+            if command == _STOP:
+                break
+            if command == _RESET:
+                NORMALIZER.reset()
+                stages.reset()
+                continue
+            if command == _RELOAD:
+                # the main process checked them already, the worker never reads the file itself
+                apply_sections(conn.recv(), stages.reconfigure, live=False, source="Analysis worker config")
+                continue
+
+            slot = command
+            onsets = stages.onsets
+            t_start = time.perf_counter_ns()
+            bands_rms = stages.analyzer.process(audio[slot])
+            t_fft = time.perf_counter_ns()
+            beat = onsets.process() if onsets is not None else False
+            t_onset = time.perf_counter_ns()
+            silent = not np.any(bands_rms)
+            if not silent:
+                np.copyto(bands[slot], NORMALIZER.process(bands_rms))
+            t_normalize = time.perf_counter_ns()
+            left, right = stages.balance() or (1.0, 1.0)
+            conn.send_bytes(_RESULT.pack(
+                slot, silent, beat, t_fft - t_start, t_onset - t_fft, t_normalize - t_onset, left, right))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del audio, bands
+        audio_shm.close()
+        bands_shm.close()
+        conn.close()
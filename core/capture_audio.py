@@ -1,47 +1,250 @@
 import asyncio
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from core.config import CONFIG
+from core.ring_buffer import AudioRingBuffer
+from utils.logger import logger
+from utils.metrics import METRICS
 
 
-def handle_chunk(raw: bytes):
-    data = np.frombuffer(raw, dtype=np.float32)
-    return data
-
-
-async def capture_audio(chunk_size: int = 1024):
-    process = await asyncio.create_subprocess_exec(
-        "ffmpeg",
-        "-f", CONFIG.audio.FORMAT_AUDIO_CARD,
-        "-i", CONFIG.audio.MONITOR_SRC,
-        "-f", CONFIG.audio.RAW_FORMAT,
-        "-acodec", CONFIG.audio.CODEC,
-        "-ac", str(CONFIG.audio.CHANNELS),
-        "-ar", str(CONFIG.audio.SAMPLERATE),
-        CONFIG.audio.OUTPUT,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.DEVNULL
-    )
-
-    bytes_per_frame = CONFIG.audio.SAMPLE_WIDTH * CONFIG.audio.CHANNELS
-    target_bytes = chunk_size * bytes_per_frame
-    buffer = b""
-
-    while True:
-        chunk = await process.stdout.read(target_bytes - len(buffer))
-        if not chunk:
-            break
+# =====================
+# CAPTURE BACKENDS
+# =====================
 
-        buffer += chunk
+class CaptureBackend:
+    """
+    Audio source for `capture_audio`: writes interleaved float32 frames (CONFIG.audio channels/samplerate)
+    straight into the ring buffer free space.
+    """
 
-        while len(buffer) >= target_bytes:
-            frame, buffer = buffer[:target_bytes], buffer[target_bytes:]
-            yield handle_chunk(frame)
+    def start(self):
+        pass
 
-def main():
-    for i, chunk in enumerate(capture_audio()):
-        print(f"Got chunk {i}, size={len(chunk)} bytes")
+    async def read(self, buffer: memoryview) -> int:
+        """ fills `buffer` (at least a part of it), returns the number of bytes written, 0 -> end of the stream """
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class FfmpegBackend(CaptureBackend):
+    """ ffmpeg subprocess (pulse/dshow/openal input), its stdout pipe is read with readinto """
+
+    def __init__(self):
+        self._process = None
+        # blocking pipe reads are done in one dedicated thread
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-reader")
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-f", CONFIG.audio.FORMAT_AUDIO_CARD,
+                "-i", CONFIG.audio.MONITOR_SRC,
+                "-f", CONFIG.audio.RAW_FORMAT,
+                "-acodec", CONFIG.audio.CODEC,
+                "-ac", str(CONFIG.audio.CHANNELS),
+                "-ar", str(CONFIG.audio.SAMPLERATE),
+                CONFIG.audio.OUTPUT,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,  # raw pipe, readinto goes directly into the ring buffer
+        )
+
+    async def read(self, buffer: memoryview) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, self._process.stdout.readinto, buffer)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+        self._reader.shutdown(wait=False)
+
+
+class PyAudioBackend(CaptureBackend):
+    """
+    In-process PortAudio capture (ALSA/PulseAudio on Linux) with a callback every PERIOD_SIZE frames,
+    no subprocess and no pipe buffering.
+    Up to `max_periods` periods wait for the event loop, a stalled loop loses the oldest ones (not the memory).
+    """
+
+    def __init__(self, device_index: int | None = None, period_size: int = 256, max_periods: int = 16):
+        self.device_index = device_index
+        self.period_size = period_size
+        self.max_periods = max_periods
+        self._pa = None
+        self._stream = None
+        self._loop = None
+        self._queue = None
+        self._pending = memoryview(b"")
+        # pyaudio.paContinue / paComplete, looked up once (the callback runs every period)
+        self._continue = None
+        self._complete = None
+
+    def start(self):
+        import pyaudio
+
+        self._continue = pyaudio.paContinue
+        self._complete = pyaudio.paComplete
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_periods)
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            format=pyaudio.paFloat32,
+            channels=CONFIG.audio.CHANNELS,
+            rate=CONFIG.audio.SAMPLERATE,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.period_size,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        # PortAudio thread
+        try:
+            self._loop.call_soon_threadsafe(self._put, in_data)
+        except RuntimeError:
+            # the event loop is closed
+            return None, self._complete
+        return None, self._continue
+
+    def _put(self, data: bytes):
+        # event loop thread: the newest audio matters, the oldest queued period goes
+        if self._queue.full():
+            self._queue.get_nowait()
+            METRICS.count("audio_periods_dropped")
+        self._queue.put_nowait(data)
+
+    async def read(self, buffer: memoryview) -> int:
+        if not self._pending:
+            self._pending = memoryview(await self._queue.get())
+
+        nbytes = min(len(buffer), len(self._pending))
+        buffer[:nbytes] = self._pending[:nbytes]
+        self._pending = self._pending[nbytes:]
+        return nbytes
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+class FileBackend(CaptureBackend):
+    """ audio file (anything soundfile reads), paced in real time or as fast as possible """
+
+    def __init__(self, path: str, realtime: bool = True, period_size: int = 256):
+        self.path = path
+        self.realtime = realtime
+        self.period_size = period_size
+        self._file = None
+        self._started = 0.0
+        self._frames_read = 0
+
+    def start(self):
+        import soundfile
+
+        self._file = soundfile.SoundFile(self.path)
+        samplerate, channels = self._file.samplerate, self._file.channels
+        if samplerate != CONFIG.audio.SAMPLERATE or channels != CONFIG.audio.CHANNELS:
+            self.stop()
+            raise ValueError(
+                f"{self.path} is {samplerate} Hz / {channels} channels, "
+                f"expected {CONFIG.audio.SAMPLERATE} Hz / {CONFIG.audio.CHANNELS} channels")
+        self._started = time.monotonic()
+        self._frames_read = 0
+
+    async def read(self, buffer: memoryview) -> int:
+        channels = CONFIG.audio.CHANNELS
+        frame_bytes = CONFIG.audio.SAMPLE_WIDTH * channels
+        frames = min(len(buffer) // frame_bytes, self.period_size)
+
+        out = np.frombuffer(buffer, dtype=np.float32, count=frames * channels).reshape(frames, channels)
+        frames = len(self._file.read(frames, dtype="float32", out=out))
+        self._frames_read += frames
+
+        if self.realtime:
+            delay = self._started + self._frames_read / CONFIG.audio.SAMPLERATE - time.monotonic()
+            await asyncio.sleep(max(delay, 0.0))
+        else:
+            # let the other tasks run
+            await asyncio.sleep(0)
+        return frames * frame_bytes
+
+    def stop(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+BACKENDS = ("ffmpeg", "pyaudio", "file")
+
+
+def create_backend(name: str | None = None, path: str | None = None) -> CaptureBackend:
+    """ backend by name (default CONFIG.audio.BACKEND) """
+    name = name or CONFIG.audio.BACKEND
+    if name == "ffmpeg":
+        return FfmpegBackend()
+    if name == "pyaudio":
+        return PyAudioBackend(
+            CONFIG.audio.PYAUDIO_DEVICE_INDEX, CONFIG.audio.PERIOD_SIZE, CONFIG.audio.PYAUDIO_MAX_PERIODS)
+    if name == "file":
+        path = path or CONFIG.audio.INPUT_FILE
+        if not path:
+            raise ValueError("The file backend needs an input file")
+        return FileBackend(path, period_size=CONFIG.audio.PERIOD_SIZE)
+    raise ValueError(f"Unknown capture backend {name!r}, expected one of {BACKENDS}")
+
+
+async def capture_audio(chunk_size: int = 1024, hop_size: int | None = None, backend: CaptureBackend | None = None):
+    """
+    Yields float32 windows (`chunk_size` frames) of the captured audio, a new one every `hop_size` frames
+    (`hop_size=None` -> no overlap).
+    The backend writes straight into the ring buffer, the windows are views over it
+    and stay valid only until the next iteration.
+    """
+    backend = backend or create_backend()
+    ring = AudioRingBuffer(chunk_size, CONFIG.audio.CHANNELS, hop_size)
+    backend.start()
+    logger.info(f"Audio capture started ({type(backend).__name__}).")
+
+    try:
+        while True:
+            read_start = time.perf_counter_ns()
+            nbytes = await backend.read(ring.writable())
+            if not nbytes:
+                break
+            # includes waiting for the audio
+            METRICS.record("capture", time.perf_counter_ns() - read_start)
+
+            ring.commit(nbytes)
+
+            while (window := ring.read_window()) is not None:
+                yield window
+    finally:
+        backend.stop()
+
+async def _print_windows():
+    i = 0
+    async for window in capture_audio():
+        print(f"Got window {i}, size={len(window)} samples")
+        i += 1
         if i > 5:
             break
 
+def main():
+    asyncio.run(_print_windows())
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,12 @@
+import dataclasses
+import os
+import tomllib
+import typing
 from dataclasses import dataclass, field
 from functools import cached_property
 from datetime import timedelta
+from core.filterbank import SCALE_CUSTOM, scale_bands
+from utils.logger import logger
 
 # =====================
 # CONFIG DATACLASSES
@@ -9,6 +15,17 @@ from datetime import timedelta
 # dataclass for capture audio channels, monitors etc
 @dataclass(frozen=True)
 class AudioConfig:
+    # "ffmpeg" - ffmpeg subprocess (MONITOR_SRC below), "pyaudio" - in-process PortAudio callback capture,
+    # "file" - INPUT_FILE played in real time
+    BACKEND: str = "ffmpeg"
+    # PortAudio input device (None -> the default input, e.g. set PULSE_SOURCE to the monitor)
+    PYAUDIO_DEVICE_INDEX: int | None = None
+    # frames per PortAudio callback / file read
+    PERIOD_SIZE: int = 256
+    # PortAudio periods queued for the event loop, when it falls behind the oldest one is dropped
+    PYAUDIO_MAX_PERIODS: int = 16
+    INPUT_FILE: str = ""
+
     MONITOR_SRC: str = 'alsa_output.pci-0000_00_1f.3.analog-stereo.monitor'
     FORMAT_AUDIO_CARD: str = "pulse"
     CODEC: str = "pcm_f32le"
@@ -17,6 +34,8 @@ class AudioConfig:
     SAMPLERATE: int = 44100
     OUTPUT: str = "pipe:1"
     CHUNK_SIZE: int = 1024 * 1
+    # analysis runs every HOP_SIZE new frames over the last CHUNK_SIZE frames (HOP_SIZE == CHUNK_SIZE -> no overlap)
+    HOP_SIZE: int = 256
     FLUSH_PACKETS: int = 0
     BLOCK_SIZE: int = 65536
 
@@ -35,18 +54,18 @@ class PadsConfig:
     BOTTOM_Y_POS: int = 9
 
     # RGB low, mid, high has different colors
-    LOW_START_Y_POS = 6
-    LOW_END_Y_POS = 8
-    MID_START_Y_POS = 3
-    MID_END_Y_POS = 5
-    HIGH_START_Y_POS = 1
-    HIGH_END_Y_POS = 2
+    LOW_START_Y_POS: int = 6
+    LOW_END_Y_POS: int = 8
+    MID_START_Y_POS: int = 3
+    MID_END_Y_POS: int = 5
+    HIGH_START_Y_POS: int = 1
+    HIGH_END_Y_POS: int = 2
 
     # Range of side buttons (left, top, right, bottom)
-    TOP_X_RANGE = (0, 8)
-    BOTTOM_X_RANGE = (0, 8)
-    LEFT_Y_RANGE = (1, 9)
-    RIGHT_Y_RANGE = (1, 9)
+    TOP_X_RANGE: tuple[int, int] = (0, 8)
+    BOTTOM_X_RANGE: tuple[int, int] = (0, 8)
+    LEFT_Y_RANGE: tuple[int, int] = (1, 9)
+    RIGHT_Y_RANGE: tuple[int, int] = (1, 9)
 
     TURN_ON_TOP_BUTTONS: bool = True
     TURN_ON_BOTTOM_BUTTONS: bool = True
@@ -60,43 +79,54 @@ class ColorConfig:
     MIN_VAL: int = 0   # min value
 
     # Central pads color (the bands)
-    RGB_LOW = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
-    RGB_MID = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
-    RGB_HIGH = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
+    RGB_LOW: tuple[int, int, int] = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
+    RGB_MID: tuple[int, int, int] = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
+    RGB_HIGH: tuple[int, int, int] = (MIN_VAL, MAX_VAL, MAX_VAL // 2)
 
     # Side buttons color
-    TOP_RGB = (MIN_VAL, MIN_VAL, MAX_VAL)
-    BOTTOM_RGB = (MAX_VAL // 2, MAX_VAL // 2, MAX_VAL // 2)
+    TOP_RGB: tuple[int, int, int] = (MIN_VAL, MIN_VAL, MAX_VAL)
+    BOTTOM_RGB: tuple[int, int, int] = (MAX_VAL // 2, MAX_VAL // 2, MAX_VAL // 2)
 
     # start and end colors (gradient)
-    RIGHT_START_RGB = (MAX_VAL, MIN_VAL, MIN_VAL)
-    RIGHT_END_RGB = (MIN_VAL, MIN_VAL, MAX_VAL)
+    RIGHT_START_RGB: tuple[int, int, int] = (MAX_VAL, MIN_VAL, MIN_VAL)
+    RIGHT_END_RGB: tuple[int, int, int] = (MIN_VAL, MIN_VAL, MAX_VAL)
 
-    LEFT_START_RGB = (MIN_VAL, MIN_VAL, MAX_VAL)
-    LEFT_END_RGB = (MAX_VAL, MIN_VAL, MIN_VAL)
+    LEFT_START_RGB: tuple[int, int, int] = (MIN_VAL, MIN_VAL, MAX_VAL)
+    LEFT_END_RGB: tuple[int, int, int] = (MAX_VAL, MIN_VAL, MIN_VAL)
 
     # top and bottom has dynamic end colors
 
-    OFF_COLOR_RGB = (MIN_VAL, MIN_VAL, MIN_VAL)
+    OFF_COLOR_RGB: tuple[int, int, int] = (MIN_VAL, MIN_VAL, MIN_VAL)
+
+    # the pad bars color at the beat flash peak
+    BEAT_RGB: tuple[int, int, int] = (MAX_VAL, MAX_VAL, MAX_VAL)
 
 @dataclass(frozen=True)
 class EmaConfig:
     # EMA for monitoring peaks
     FAST_SMOOTHING: float = 0.8
     SLOW_SMOOTHING: float = 0.05
+    # the smoothing values are tuned for one update per REFERENCE_HOP frames,
+    # they are rescaled for the real hop size so the response time does not depend on it
+    REFERENCE_HOP: int = 2048
 
 @dataclass(frozen=True)
 class BandsConfig:
     # Frequency bands converter
     MAX_FQ: int = 22050
     MIN_FQ: int = 0
+    # "custom" - the RANGE list below, "log"/"mel"/"bark" - COUNT bands between MIN_FQ and MAX_FQ on that scale
+    SCALE: str = "custom"
+    COUNT: int = 16
+    # overlapping triangular filters (mel filterbank style) instead of rectangular bands
+    TRIANGULAR: bool = False
     RANGE: list[tuple[int, int]] = field(init=False)
 
-    # TODO: change from config to constants
-    FAST: list[float] = field(init=False)   # fast EMA values
-    SLOW: list[float] = field(init=False)   # slow EMA values
-
     def __post_init__(self):
+        if self.SCALE != SCALE_CUSTOM:
+            object.__setattr__(self, 'RANGE', scale_bands(self.SCALE, self.COUNT, self.MIN_FQ, self.MAX_FQ, self.TRIANGULAR))
+            return
+
         object.__setattr__(self, 'RANGE', [
                 (0, 100),
                 (100, 200),
@@ -108,8 +138,6 @@ class BandsConfig:
                 (6400, 22050)
             ]
         )
-        object.__setattr__(self, 'FAST', [0.0] * len(self.RANGE))
-        object.__setattr__(self, 'SLOW', [0.0] * len(self.RANGE))
 
 @dataclass(frozen=True)
 class ThresholdConfig:
@@ -121,15 +149,95 @@ class ThresholdConfig:
     BOTTOM_HIGH: float = 0.7
     BOTTOM_MID_HIGH: float = 0.7
     LOW_MID_HIGH: float = 0.7
+    # normalized bands below it are cut to 0
+    NOISE_GATE: float = 0.08
 
     SIDE_HALF_THRESHOLD: list[float] = field(init=False)
 
     PAUSE_THRESHOLD_TO_RESET_STATE: timedelta = timedelta(seconds=0.25)
+    # a window is silent when its RMS and peak are both below these (-70 / -60 dBFS), checked before the FFT
+    SILENCE_RMS: float = 0.0003
+    SILENCE_PEAK: float = 0.001
 
     def __post_init__(self):
         object.__setattr__(self, 'SIDE_HALF_THRESHOLD', [0.2, 0.3, 0.6, 0.7])
 
 
+@dataclass(frozen=True)
+class DevicesConfig:
+    # launchpad_py port numbers of the grids, empty -> search for COUNT grids
+    PORTS: tuple[int, ...] = ()
+    COUNT: int = 1
+    # "mirror" - every grid shows all the bands, "span" - the bands are split across the grids (left to right)
+    LAYOUT: str = "mirror"
+    # the grids are found by the port name and driven through python-rtmidi, falls back to launchpad_py
+    # (PORTS above are launchpad_py port numbers, setting them skips rtmidi)
+    RTMIDI: bool = True
+    # rtmidi ports of the grids: the name contains MIDI_PORT_NAME and none of MIDI_PORT_SKIP
+    # (standalone / DIN ports of the Launchpad Pro), the n-th matching port is the n-th grid
+    MIDI_PORT_NAME: str = "Launchpad Pro"
+    MIDI_PORT_SKIP: tuple[str, ...] = ("MIDI 2", "MIDI 3", "MIDIIN2", "MIDIIN3")
+    # last known ports of the grids, tried first on the next start
+    PORT_CACHE: str = "~/.cache/launchpad_audio_visualizer/ports.json"
+    # unplugged grids are looked for every HOTPLUG_INTERVAL seconds and reconnected (0 -> off)
+    HOTPLUG_INTERVAL: float = 1.0
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    # per-stage latency summary in the log, seconds (0 -> off)
+    SUMMARY_INTERVAL: float = 30.0
+    # local HTTP endpoint with the metrics as JSON (port 0 -> off, the --metrics-port flag overrides it)
+    HTTP_HOST: str = "127.0.0.1"
+    HTTP_PORT: int = 0
+
+@dataclass(frozen=True)
+class BeatConfig:
+    # spectral-flux onsets and the tempo, computed from the analysis spectrum every hop
+    ENABLED: bool = True
+    # onset when the flux is THRESHOLD times above its running mean (over MEAN_SECONDS)
+    THRESHOLD: float = 1.5
+    MEAN_SECONDS: float = 1.0
+    # shortest time between two onsets, seconds
+    MIN_INTERVAL: float = 0.1
+    BPM_RANGE: tuple[float, float] = (60.0, 200.0)
+    # the pad bars flash on every beat, the flash fades out in FLASH_DECAY seconds
+    FLASH: bool = True
+    FLASH_DECAY: float = 0.15
+
+@dataclass(frozen=True)
+class AnalysisConfig:
+    # FFT analysis and normalization in a separate process (shared memory slots), frees the main loop
+    WORKER_PROCESS: bool = False
+    # windows in flight between the main loop and the analysis process
+    WORKER_SLOTS: int = 4
+    # per channel bands (one batched FFT over both channels), the side columns follow the stereo panning
+    STEREO: bool = False
+    # "auto" -> the fastest installed FFT backend (pyfftw, scipy, numpy) measured at startup, or one of them
+    FFT_BACKEND: str = "auto"
+    # FFT threads (scipy workers / FFTW threads), 0 -> all the cores
+    FFT_WORKERS: int = 1
+    # window sizes (frames) tried at startup: the largest one analyzed within FFT_BUDGET of a hop period is used,
+    # larger windows give a finer bass resolution (() -> AudioConfig.CHUNK_SIZE)
+    FFT_SIZES: tuple[int, ...] = ()
+    FFT_BUDGET: float = 0.25
+
+@dataclass(frozen=True)
+class PublishConfig:
+    # Unix domain socket streaming the band frames to local subscribers ("" -> off, the --publish flag overrides it)
+    SOCKET_PATH: str = ""
+    # frames buffered per subscriber (socket send buffer size, at least the kernel minimum of a few KB),
+    # a slower subscriber drops the newer frames (the analysis never waits)
+    MAX_PENDING: int = 4
+
+@dataclass(frozen=True)
+class RenderConfig:
+    # LED refresh rate, the analysis runs every hop and the grid shows the latest bands at this rate
+    TARGET_FPS: float = 60.0
+    # the refresh rate is lowered down to MIN_FPS while the MIDI flush takes longer than FLUSH_BUDGET of a frame
+    MIN_FPS: float = 15.0
+    FLUSH_BUDGET: float = 0.8
+
+
 # =====================
 # INITIALIZE CONFIG
 # =====================
@@ -160,9 +268,142 @@ class Config:
     def audio(self) -> AudioConfig:
         return AudioConfig()
 
+    @cached_property
+    def devices(self) -> DevicesConfig:
+        return DevicesConfig()
+
+    @cached_property
+    def metrics(self) -> MetricsConfig:
+        return MetricsConfig()
+
+    @cached_property
+    def beat(self) -> BeatConfig:
+        return BeatConfig()
+
+    @cached_property
+    def analysis(self) -> AnalysisConfig:
+        return AnalysisConfig()
+
+    @cached_property
+    def render(self) -> RenderConfig:
+        return RenderConfig()
+
+    @cached_property
+    def publish(self) -> PublishConfig:
+        return PublishConfig()
+
+
+# =====================
+# CONFIG FILE
+# =====================
+
+# TOML file with the overrides: [section] tables (Config attribute names) of UPPER_CASE dataclass fields,
+# e.g. [colors] RGB_LOW = [0, 63, 31]. Loaded at import, so every process (the analysis worker too) sees it.
+CONFIG_FILE_ENV = "LAUNCHPAD_VISUALIZER_CONFIG"
+DEFAULT_CONFIG_FILE = "config.toml"
+# sections applied while running (between frames), the others are read at startup only
+LIVE_SECTIONS = ("pads", "colors", "ema", "bands", "threshold", "beat", "render")
+
+
+def config_file_path() -> str:
+    return os.environ.get(CONFIG_FILE_ENV, DEFAULT_CONFIG_FILE)
+
+
+def config_sections() -> list[str]:
+    return [name for name, attr in vars(Config).items() if isinstance(attr, cached_property)]
+
+
+def read_config_file(path: str) -> dict:
+    """
+    section name -> dataclass instance: the defaults updated with the file values
+    (a section or a key missing in the file is the default). Raises ValueError on unknown or mistyped keys.
+    """
+    with open(path, "rb") as file:
+        data = tomllib.load(file)
+
+    sections = config_sections()
+    unknown = set(data) - set(sections)
+    if unknown:
+        raise ValueError(f"{path}: unknown sections {sorted(unknown)}, expected some of {sections}")
+
+    result = {}
+    default_config = Config()
+    for name in sections:
+        defaults = getattr(default_config, name)
+        cls = type(defaults)
+        values = data.get(name, {})
+        fields = {f.name: f.type for f in dataclasses.fields(cls) if f.init}
+        kwargs = {}
+        for key, value in values.items():
+            if key not in fields:
+                raise ValueError(f"{path}: [{name}] has no setting {key!r}")
+            value = _convert(value, getattr(defaults, key), f"[{name}] {key}")
+            _check_tuple(value, fields[key], f"[{name}] {key}")
+            kwargs[key] = value
+        result[name] = cls(**kwargs)
+    return result
+
+
+def _convert(value, default, key: str):
+    """ TOML value -> the type of the default (arrays -> tuples, seconds -> timedelta) """
+    if default is None:
+        return value
+    if isinstance(default, timedelta) and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return timedelta(seconds=value)
+    if isinstance(default, tuple) and isinstance(value, list):
+        return tuple(tuple(item) if isinstance(item, list) else item for item in value)
+    if isinstance(default, float) and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if type(value) is not type(default):
+        raise ValueError(f"{key} must be {type(default).__name__}, got {value!r}")
+    return value
+
+
+def _check_tuple(value, annotation, key: str):
+    """ fixed size tuples (RGB colors, ranges) must have exactly their items, `tuple[x, ...]` any number of them """
+    if typing.get_origin(annotation) is not tuple or not isinstance(value, tuple):
+        return
+    args = typing.get_args(annotation)
+    if len(args) == 2 and args[1] is Ellipsis:
+        types = (args[0],) * len(value)
+    elif len(value) != len(args):
+        raise ValueError(f"{key} must have {len(args)} items, got {list(value)!r}")
+    else:
+        types = args
+    for item, item_type in zip(value, types):
+        # an int is fine where a float is expected
+        allowed = (int, float) if item_type is float else item_type
+        if isinstance(allowed, (type, tuple)) and (not isinstance(item, allowed) or isinstance(item, bool)):
+            raise ValueError(f"{key} items must be {item_type.__name__}, got {list(value)!r}")
+
+
+def apply_config(config: Config, sections: dict, live: bool = False) -> list[str]:
+    """
+    swaps the changed sections into the config (each one is a single attribute assignment),
+    returns their names. `live` -> the sections outside LIVE_SECTIONS and band count changes are kept
+    as they are (they need a restart).
+    """
+    changed = []
+    for name, section in sections.items():
+        current = getattr(config, name)
+        if section == current:
+            continue
+        if live and name not in LIVE_SECTIONS:
+            logger.warning(f"Config [{name}] changed, it is applied after a restart.")
+            continue
+        if live and name == "bands" and len(section.RANGE) != len(current.RANGE):
+            logger.warning(f"Config [bands] changes the number of bands ({len(current.RANGE)} -> {len(section.RANGE)}), it is applied after a restart.")
+            continue
+        # cached_property keeps the instance in __dict__
+        config.__dict__[name] = section
+        changed.append(name)
+    return changed
+
 
 # =====================
 # SINGLETON INSTANCE
 # =====================
 
 CONFIG = Config()
+if os.path.exists(config_file_path()):
+    apply_config(CONFIG, read_config_file(config_file_path()))
@@ -0,0 +1,73 @@
+import os
+from core.config import CONFIG, apply_config, read_config_file
+from utils.logger import logger
+
+# how often the config file is checked, seconds
+WATCH_INTERVAL = 0.5
+
+
+def reload_config(path: str, rebuild=None, restore=None) -> list[str]:
+    """
+    reads the file and swaps the changed live sections into CONFIG, returns their names.
+    `rebuild`/`restore` -> see `apply_sections`, so a value the file format accepts but the pipeline can't use
+    is logged and ignored.
+    """
+    try:
+        sections = read_config_file(path)
+    except (OSError, ValueError, TypeError) as e:
+        # a half-saved or broken file: the running config stays as it is
+        logger.error(f"Config {path} not applied: {e}")
+        return []
+    return apply_sections(sections, rebuild, restore, source=f"Config {path}")
+
+
+def apply_sections(sections: dict, rebuild=None, restore=None, live: bool = True, source: str = "Config") -> list[str]:
+    """
+    swaps the changed sections into CONFIG, returns their names.
+    `rebuild(changed)` rebuilds what depends on them, if it fails the previous sections are restored
+    and `restore(changed)` (default `rebuild`) rebuilds them again.
+    """
+    previous = {name: getattr(CONFIG, name) for name in sections}
+    changed = apply_config(CONFIG, sections, live=live)
+    if changed and rebuild is not None:
+        try:
+            rebuild(changed)
+        except Exception:
+            logger.exception(f"{source} not applied, the previous config is restored.")
+            apply_config(CONFIG, previous)
+            try:
+                (restore or rebuild)(changed)
+            except Exception:
+                # the watcher keeps running, the next saved file gets another try
+                logger.exception(f"{source}: the previous config can't be rebuilt either.")
+            return []
+    if changed:
+        logger.info(f"{source} reloaded: {', '.join(changed)}.")
+    return changed
+
+
+class ConfigWatcher:
+    """
+    Polls the config file (mtime and size) and reloads it when it changes.
+    The caller rebuilds what depends on the changed sections (windows, filterbanks, LUTs).
+    """
+
+    def __init__(self, path: str, interval: float = WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self, rebuild=None, restore=None) -> list[str]:
+        """ names of the sections changed since the last call, `rebuild`/`restore` -> see `apply_sections` """
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return []
+        self._stamp = stamp
+        return reload_config(self.path, rebuild, restore)
@@ -0,0 +1,65 @@
+import math
+from launchpad_py import launchpad
+from core.led_frame import FrameBuffer
+from core.midi_output import MidiOutputWorker
+from core.state import VisualizerState, smoothed_alphas, beat_decay
+
+LAYOUT_MIRROR = "mirror"  # every device shows all the bands
+LAYOUT_SPAN = "span"      # the bands are split across the devices, left to right
+LAYOUTS = (LAYOUT_MIRROR, LAYOUT_SPAN)
+
+# the side buttons use the bands 0, 1, -4, -2, -1 of the device
+MIN_DEVICE_BANDS = 4
+
+
+class LaunchpadDevice:
+    """
+    One grid of the fan-out: its own framebuffer (diff state), side buttons state, output worker
+    and the slice of the bands it shows.
+    """
+
+    def __init__(self, output: MidiOutputWorker, bands: slice = slice(None), name: str = "launchpad"):
+        self.name = name
+        self.output = output
+        self.bands = bands
+        self.frame = FrameBuffer()
+        self.vstate = VisualizerState()
+
+    @property
+    def lp(self) -> launchpad.LaunchpadPro:
+        return self.output.lp
+
+    def reset(self):
+        """ everything off: the state here and the device itself (through the output thread) """
+        self.frame.clear()
+        self.vstate.reset()
+        self.output.reset()
+
+
+def set_render_rate(devices: list[LaunchpadDevice], frames_per_render: float):
+    """ the side buttons smoothing and the beat flash fade for one render per `frames_per_render` audio frames """
+    alphas = smoothed_alphas(frames_per_render)
+    decay = beat_decay(frames_per_render)
+    for device in devices:
+        device.vstate.alphas = alphas
+        device.vstate.beat_decay = decay
+
+
+def assign_layout(devices: list[LaunchpadDevice], bands_count: int, layout: str = LAYOUT_MIRROR):
+    """ sets the bands slice of every device for the layout """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}, expected one of {LAYOUTS}")
+
+    if layout == LAYOUT_MIRROR or len(devices) == 1:
+        for device in devices:
+            device.bands = slice(None)
+        return
+
+    per_device = math.ceil(bands_count / len(devices))
+    if bands_count - per_device * (len(devices) - 1) < MIN_DEVICE_BANDS:
+        raise ValueError(
+            f"{bands_count} bands can't be spanned across {len(devices)} devices, "
+            f"every device needs at least {MIN_DEVICE_BANDS} bands")
+
+    for i, device in enumerate(devices):
+        device.bands = slice(i * per_device, (i + 1) * per_device)
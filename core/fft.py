@@ -0,0 +1,149 @@
+import os
+import time
+import numpy as np
+from utils.logger import logger
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+FFT_NUMPY = "numpy"
+FFT_SCIPY = "scipy"
+FFT_PYFFTW = "pyfftw"
+# "auto" -> the fastest installed backend, measured at startup
+FFT_AUTO = "auto"
+# preference order for equal timings
+FFT_BACKENDS = (FFT_PYFFTW, FFT_SCIPY, FFT_NUMPY)
+
+# the whole analysis path (window, spectrum, power, filterbank) runs in single precision
+REAL_DTYPE = np.float32
+COMPLEX_DTYPE = np.complex64
+
+
+class FFTPlan:
+    """
+    Real forward FFT over the last axis of a fixed shape, planned once and reused:
+    fill `input` in place, `execute()` returns the spectrum (a reused buffer, overwritten by the next call).
+    """
+
+    name = FFT_NUMPY
+
+    def __init__(self, shape: tuple[int, ...], workers: int = 1):
+        self.shape = shape
+        self.workers = workers
+        self.input = np.zeros(shape, dtype=REAL_DTYPE)
+        self.output = np.empty(shape[:-1] + (shape[-1] // 2 + 1,), dtype=COMPLEX_DTYPE)
+
+    def execute(self) -> np.ndarray:
+        # numpy >= 2 transforms float32 in single precision and writes into `out`
+        return np.fft.rfft(self.input, axis=-1, out=self.output)
+
+
+class ScipyPlan(FFTPlan):
+    """ scipy.fft: multithreaded over the batch axis with `workers` > 1 (stereo) """
+
+    name = FFT_SCIPY
+
+    def execute(self) -> np.ndarray:
+        # no `out` in scipy.fft, the input is rewritten by the analyzer before every call anyway
+        np.copyto(self.output, scipy_fft.rfft(self.input, axis=-1, workers=self.workers, overwrite_x=True))
+        return self.output
+
+
+class PyFFTWPlan(FFTPlan):
+    """ FFTW plan measured once for the shape, on SIMD-aligned buffers """
+
+    name = FFT_PYFFTW
+
+    def __init__(self, shape: tuple[int, ...], workers: int = 1):
+        super().__init__(shape, workers)
+        self.input = pyfftw.empty_aligned(shape, dtype=REAL_DTYPE)
+        self.output = pyfftw.empty_aligned(self.output.shape, dtype=COMPLEX_DTYPE)
+        self._fftw = pyfftw.FFTW(self.input, self.output, axes=(-1,), flags=("FFTW_MEASURE",), threads=workers)
+        # the measuring overwrites the input
+        self.input.fill(0.0)
+
+    def execute(self) -> np.ndarray:
+        self._fftw.execute()
+        return self.output
+
+
+_PLAN_CLASSES = {FFT_NUMPY: FFTPlan, FFT_SCIPY: ScipyPlan, FFT_PYFFTW: PyFFTWPlan}
+_PLANS: dict[tuple, FFTPlan] = {}
+
+
+def available_backends() -> list[str]:
+    """ the installed backends, in the FFT_BACKENDS order """
+    installed = {FFT_NUMPY: True, FFT_SCIPY: scipy_fft is not None, FFT_PYFFTW: pyfftw is not None}
+    return [name for name in FFT_BACKENDS if installed[name]]
+
+
+def get_plan(backend: str, shape: tuple[int, ...], workers: int = 1) -> FFTPlan:
+    """
+    returns the cached plan for the backend and shape (creates it on the first call).
+    The plans are shared: `input` must be filled right before `execute`.
+    """
+    if backend not in _PLAN_CLASSES:
+        raise ValueError(f"Unknown FFT backend {backend!r}, expected one of {FFT_BACKENDS}")
+    if backend not in available_backends():
+        raise ValueError(f"FFT backend {backend!r} is not installed")
+    workers = workers or os.cpu_count() or 1
+    key = (backend, tuple(shape), workers)
+    plan = _PLANS.get(key)
+    if plan is None:
+        plan = _PLAN_CLASSES[backend](tuple(shape), workers)
+        _PLANS[key] = plan
+    return plan
+
+
+def benchmark_analyzer(analyzer, repeats: int = 50) -> float:
+    """ median seconds of one `analyzer.process` call on a noise window (after a warmup) """
+    rng = np.random.default_rng(0)
+    chunk = rng.standard_normal(analyzer.chunk_size * analyzer.channels).astype(REAL_DTYPE) * 0.1
+    for _ in range(5):
+        analyzer.process(chunk)
+
+    timings = np.empty(repeats, dtype=np.float64)
+    for i in range(repeats):
+        start = time.perf_counter_ns()
+        analyzer.process(chunk)
+        timings[i] = time.perf_counter_ns() - start
+    return float(np.median(timings)) / 1e9
+
+
+def choose_fft(
+        create_analyzer, backend: str, sizes, default_size: int, budget: float) -> tuple[str, int]:
+    """
+    Startup benchmark: times the whole analysis (`create_analyzer(backend, size).process`) of every candidate
+    backend (`backend` == "auto" -> all the installed ones) and window size.
+    Returns the fastest backend and the largest size whose analysis takes at most `budget` seconds
+    (the smallest size if none fits, `default_size` when no sizes are given).
+    """
+    if backend != FFT_AUTO and backend not in available_backends():
+        logger.warning(f"FFT backend {backend!r} is not installed, falling back to numpy.")
+        backend = FFT_NUMPY
+    backends = available_backends() if backend == FFT_AUTO else [backend]
+    sizes = sorted(set(sizes)) or [default_size]
+    if len(backends) == 1 and len(sizes) == 1:
+        return backends[0], sizes[0]
+
+    timings = {(name, size): benchmark_analyzer(create_analyzer(name, size)) for name in backends for size in sizes}
+    for (name, size), seconds in timings.items():
+        logger.debug(f"FFT benchmark: {name} {size} -> {seconds * 1e6:.1f} us")
+
+    # the fastest backend at the largest size, it is the one the budget is tight for
+    largest = sizes[-1]
+    best = min(backends, key=lambda name: (timings[name, largest], backends.index(name)))
+    fitting = [size for size in sizes if timings[best, size] <= budget]
+    size = fitting[-1] if fitting else sizes[0]
+
+    logger.info(
+        f"FFT backend {best}, window {size} frames ({timings[best, size] * 1e6:.1f} us per analysis, "
+        f"budget {budget * 1e6:.0f} us).")
+    return best, size
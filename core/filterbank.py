@@ -0,0 +1,101 @@
+import numpy as np
+
+SCALE_CUSTOM = "custom"  # BandsConfig.RANGE as it is
+SCALE_LOG = "log"
+SCALE_MEL = "mel"
+SCALE_BARK = "bark"
+SCALES = (SCALE_CUSTOM, SCALE_LOG, SCALE_MEL, SCALE_BARK)
+
+# the log scale can't start at 0 Hz, its first edge is counted from here (the first band still starts at MIN_FQ)
+LOG_MIN_FQ = 20.0
+# the weights are not allowed below -40 dB, otherwise the lowest bands would never pass the EMA floor
+MIN_WEIGHT = 0.01
+
+
+def hz_to_scale(hz, scale: str):
+    hz = np.asarray(hz, dtype=np.float64)
+    if scale == SCALE_MEL:
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+    if scale == SCALE_BARK:
+        # Traunmüller
+        return 26.81 * hz / (1960.0 + hz) - 0.53
+    return np.log(np.maximum(hz, LOG_MIN_FQ))
+
+
+def scale_to_hz(value, scale: str):
+    value = np.asarray(value, dtype=np.float64)
+    if scale == SCALE_MEL:
+        return 700.0 * (10.0 ** (value / 2595.0) - 1.0)
+    if scale == SCALE_BARK:
+        return 1960.0 * (value + 0.53) / (26.28 - value)
+    return np.exp(value)
+
+
+def band_edges(scale: str, count: int, min_fq: float, max_fq: float, triangular: bool = False) -> np.ndarray:
+    """ edges equally spaced on the scale: count + 1 for adjacent bands, count + 2 for overlapping triangles """
+    if scale not in SCALES or scale == SCALE_CUSTOM:
+        raise ValueError(f"Unknown band scale {scale!r}, expected one of {SCALES[1:]}")
+    if count < 1 or min_fq >= max_fq:
+        raise ValueError(f"Can't build {count} bands between {min_fq} and {max_fq} Hz")
+
+    points = np.linspace(hz_to_scale(min_fq, scale), hz_to_scale(max_fq, scale), count + (2 if triangular else 1))
+    edges = scale_to_hz(points, scale)
+    edges[0], edges[-1] = min_fq, max_fq
+    return edges
+
+
+def scale_bands(scale: str, count: int, min_fq: float, max_fq: float, triangular: bool = False) -> list[tuple[float, float]]:
+    """
+    `count` bands (low, high) between min_fq and max_fq.
+    Triangular bands overlap: band i spans edges i..i+2 and peaks at the edge i+1, like a mel filterbank.
+    """
+    edges = [round(float(edge), 1) for edge in band_edges(scale, count, min_fq, max_fq, triangular)]
+    step = 2 if triangular else 1
+    return [(edges[i], edges[i + step]) for i in range(count)]
+
+
+def band_centers(bands_range, scale: str = SCALE_LOG) -> np.ndarray:
+    """ center of every band on the scale (geometric center for the log and custom bands) """
+    if scale == SCALE_CUSTOM:
+        scale = SCALE_LOG
+    bounds = np.array(bands_range, dtype=np.float64)
+    return scale_to_hz(hz_to_scale(bounds, scale).mean(axis=1), scale)
+
+
+def filter_matrix(freqs: np.ndarray, bands_range, triangular: bool = False, scale: str = SCALE_LOG) -> np.ndarray:
+    """
+    (bands, bins) weights, every row sums to 1, so `matrix @ power` is the mean power of the band.
+    Rectangular rows take the bins [low, high), triangular ones rise from low to the band center and fall to high.
+    """
+    matrix = np.zeros((len(bands_range), len(freqs)), dtype=np.float64)
+    centers = band_centers(bands_range, scale)
+
+    for i, (low, high) in enumerate(bands_range):
+        inside = (freqs >= low) & (freqs < high)
+        if triangular:
+            center = centers[i]
+            rising = np.clip((freqs - low) / max(center - low, 1e-9), 0.0, 1.0)
+            falling = np.clip((high - freqs) / max(high - center, 1e-9), 0.0, 1.0)
+            matrix[i] = np.where(inside, np.minimum(rising, falling), 0.0)
+        else:
+            matrix[i, inside] = 1.0
+
+        # a band narrower than a bin (low bands of the log scale) takes the bin nearest to its center
+        if not matrix[i].any() and len(freqs):
+            matrix[i, np.argmin(np.abs(freqs - centers[i]))] = 1.0
+
+    matrix /= matrix.sum(axis=1, keepdims=True)
+    return matrix
+
+
+def a_weighting(hz) -> np.ndarray:
+    """ linear gain of the A-weighting curve (inverse of the 40 phon equal-loudness contour), 1.0 at 1 kHz """
+    f2 = np.asarray(hz, dtype=np.float64) ** 2
+    ra = (12194.0 ** 2 * f2 ** 2) / (
+        (f2 + 20.6 ** 2) * np.sqrt((f2 + 107.7 ** 2) * (f2 + 737.9 ** 2)) * (f2 + 12194.0 ** 2))
+    return ra * 10.0 ** (2.0 / 20.0)
+
+
+def equal_loudness_weights(bands_range, scale: str = SCALE_LOG) -> np.ndarray:
+    """ per band weights from the equal-loudness curve at the band centers """
+    return np.maximum(a_weighting(band_centers(bands_range, scale)), MIN_WEIGHT)
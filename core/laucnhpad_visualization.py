@@ -1,210 +1,209 @@
-import asyncio
-from launchpad_py import launchpad
+import numpy as np
 from core.config import CONFIG
-from core.state import BANDS_POS, VISUAL_SIDE_STATE_CACHE, VSTATE, ALPHA_0_100, ALPHA_100_200, ALPHA_6400_22000, ALPHA_800_1600, VSSCACHE_RIGHT_INDEX, VSSCACHE_TOP_INDEX, VSSCACHE_BOTTOM_INDEX
+from core.devices import LaunchpadDevice
+from core.led_frame import FrameBuffer, LED_MAX_VAL
+from core.spectrum import SIDE_BANDS
+from core.state import (
+    VisualizerState,
+    SMOOTHED_0_100, SMOOTHED_100_200, SMOOTHED_800_1600, SMOOTHED_3200_6400, SMOOTHED_6400_22000,
+)
 
+# side buttons colors are looked up by the intensity quantized to LUT_LEVELS steps
+LUT_LEVELS = 256
+# the beat flash of the pads fades out in BEAT_STEPS colors
+BEAT_STEPS = 8
 
-async def visualize_audio_bands(lp: launchpad.LaunchpadPro, bands_arr):
-    global VSTATE, BANDS_POS, CONFIG
-    tasks = []
 
-    for pad_x, val in enumerate(bands_arr):
-        new_level = round(val * CONFIG.pads.PADS_IN_COLUMN)
-
-        if len(BANDS_POS) <= pad_x:
-            BANDS_POS.append(0)
-
-        old_level = BANDS_POS[pad_x]
-
-        if new_level != old_level:
-            # only changed buttons
-            if new_level > old_level:
-                level_from = old_level
-                level_to = new_level
-                level_side = 1
-                # only new buttons
-            else:
-                level_from = new_level
-                level_to = old_level
-                level_side = -1
-                # lights off other
-            for y in range(level_from + 1, level_to + 1):
-                pad_y = CONFIG.pads.PADS_IN_COLUMN - y + 1
-                tasks.append(_visualize_pad_button(lp, pad_x, pad_y, level_side=level_side))
-
-            BANDS_POS[pad_x] = new_level
-
-    if tasks:
-        await asyncio.gather(*tasks)
+class GridLayout:
+    """
+    Everything about the grid that does not change between frames (positions, thresholds, colors),
+    precomputed as arrays so a frame is rendered with array operations only.
+    """
 
-    await _visualize_side_buttons(
-        lp, bands_arr[0], bands_arr[1],
-        bands_arr[-4], bands_arr[-2], bands_arr[-1])
+    def __init__(self):
+        pads = CONFIG.pads
+        colors = CONFIG.colors
+
+        # pad rows 1..PADS_IN_COLUMN (top to bottom) and their colors
+        self.pad_rows = np.arange(1, pads.PADS_IN_COLUMN + 1)
+        # bands count -> first band of every pad column, for more bands than columns
+        self._column_starts = {}
+        self.pad_row_colors = np.zeros((len(self.pad_rows), 3), dtype=np.uint8)
+        for i, pad_y in enumerate(self.pad_rows):
+            if pads.LOW_START_Y_POS <= pad_y <= pads.LOW_END_Y_POS:
+                self.pad_row_colors[i] = colors.RGB_LOW
+            elif pads.MID_START_Y_POS <= pad_y <= pads.MID_END_Y_POS:
+                self.pad_row_colors[i] = colors.RGB_MID
+            elif pads.HIGH_START_Y_POS <= pad_y <= pads.HIGH_END_Y_POS:
+                self.pad_row_colors[i] = colors.RGB_HIGH
+
+        # (BEAT_STEPS + 1, rows, 3): the row colors blended towards BEAT_RGB by the beat flash level
+        flash = np.linspace(0.0, 1.0, BEAT_STEPS + 1)[:, None, None]
+        row_colors = self.pad_row_colors[None, :, :].astype(np.float64)
+        self.pad_beat_colors = np.clip(
+            np.rint(row_colors + (np.array(colors.BEAT_RGB, dtype=np.float64) - row_colors) * flash),
+            0, LED_MAX_VAL).astype(np.uint8)
+
+        # left and right columns (the right one is counted from the bottom)
+        self.left_rows = np.arange(*pads.LEFT_Y_RANGE)
+        self.right_rows = pads.PADS_IN_COLUMN + 1 - np.arange(*pads.RIGHT_Y_RANGE)
+
+        # intensity (quantized) -> color tables of the side buttons
+        self.lut_levels = np.linspace(0.0, 1.0, LUT_LEVELS)
+        self.left_lut = self._gradient_lut(CONFIG.threshold.LEFT_SUB, colors.LEFT_START_RGB, colors.LEFT_END_RGB)
+        self.right_lut = self._gradient_lut(CONFIG.threshold.RIGHT_BASS, colors.RIGHT_START_RGB, colors.RIGHT_END_RGB)
+
+        # top and bottom rows are split into halves, each half counts its buttons from the edge
+        self.top_xs, top_thresholds, top_halves = self._split_row(pads.TOP_X_RANGE)
+        self.top_sources = np.where(top_halves == 0, SMOOTHED_800_1600, SMOOTHED_3200_6400)
+        # left: green-blue tones, right: purple-pink tones
+        top_coefs = np.where(top_halves[:, None] == 0, (0.3, 0.7, 0.8), (0.8, 0.3, 0.7))
+        self.top_buttons = np.arange(len(self.top_xs))
+        self.top_lut = self._split_row_lut(top_thresholds, top_coefs)
+
+        self.bottom_xs, bottom_thresholds, bottom_halves = self._split_row(pads.BOTTOM_X_RANGE)
+        self.bottom_sources = np.where(bottom_halves == 0, SMOOTHED_3200_6400, SMOOTHED_6400_22000)
+        # left (mid): orange tones, right (high = hats/sibilants): blue tones
+        bottom_coefs = np.where(bottom_halves[:, None] == 0, (1.0, 0.6, 0.0), (0.4, 0.5, 1.0))
+        self.bottom_buttons = np.arange(len(self.bottom_xs))
+        self.bottom_lut = self._split_row_lut(bottom_thresholds, bottom_coefs)
+
+    def _gradient_lut(self, threshold: float, start_rgb, end_rgb) -> np.ndarray:
+        ''' (LUT_LEVELS, 3): start -> end color by intensity, off up to the threshold '''
+        start = np.array(start_rgb, dtype=np.float64)
+        colors = start + (np.array(end_rgb, dtype=np.float64) - start) * self.lut_levels[:, None]
+        lut = np.clip(colors, 0, LED_MAX_VAL).astype(np.uint8)
+        lut[self.lut_levels <= threshold] = CONFIG.colors.OFF_COLOR_RGB
+        return lut
+
+    def _split_row_lut(self, thresholds: np.ndarray, coefs: np.ndarray) -> np.ndarray:
+        ''' (buttons, LUT_LEVELS, 3): a button is on when its half intensity reaches its threshold '''
+        colors = CONFIG.colors.MAX_VAL * coefs[:, None, :] * self.lut_levels[None, :, None]
+        colors[self.lut_levels[None, :] < thresholds[:, None]] = CONFIG.colors.MIN_VAL
+        return np.clip(colors, 0, LED_MAX_VAL).astype(np.uint8)
+
+    def column_starts(self, bands_count: int) -> np.ndarray:
+        """ first band of every pad column: the bands are grouped into PADS_IN_COLUMN adjacent, near equal groups """
+        starts = self._column_starts.get(bands_count)
+        if starts is None:
+            columns = CONFIG.pads.PADS_IN_COLUMN
+            starts = np.arange(columns) * bands_count // columns
+            self._column_starts[bands_count] = starts
+        return starts
+
+    @staticmethod
+    def _split_row(x_range):
+        """ returns xs, per button thresholds and the half (0 - left, 1 - right) of every button of the row """
+        start, end = x_range
+        middle = (start + end) // 2
+        thresholds = CONFIG.threshold.SIDE_HALF_THRESHOLD
 
+        left = np.arange(start, middle)
+        right = np.arange(end - 1, middle - 1, -1)
+        xs = np.concatenate((left, right))
+        steps = np.concatenate((np.arange(len(left)), np.arange(len(right))))
+        halves = np.concatenate((np.zeros(len(left), dtype=int), np.ones(len(right), dtype=int)))
+        return xs, np.array(thresholds)[steps % len(thresholds)], halves
 
-async def _visualize_pad_button(
-        lp: launchpad.LaunchpadPro,
-        pad_x: int, pad_y: int, level_side: int = 1):
-    ''' check range of the pads and set the apporpriate color '''
-    global VISUAL_PAD_STATE_CACHE, CONFIG
 
-    r = g = b = CONFIG.colors.MIN_VAL
+LAYOUT = GridLayout()
 
-    # check that we need to growth
-    if level_side > -1:
-        if CONFIG.pads.LOW_START_Y_POS <= pad_y <= CONFIG.pads.LOW_END_Y_POS:
-            r, g, b = CONFIG.colors.RGB_LOW
-        elif CONFIG.pads.MID_START_Y_POS <= pad_y <= CONFIG.pads.MID_END_Y_POS:
-            r, g, b = CONFIG.colors.RGB_MID
-        elif CONFIG.pads.HIGH_START_Y_POS <= pad_y <= CONFIG.pads.HIGH_END_Y_POS:
-            r, g, b = CONFIG.colors.RGB_HIGH
 
-    lp.LedCtrlXY(pad_x, pad_y, r, g, b)
+def rebuild_layout():
+    """ new positions/thresholds/colors tables from the current config (config reload), used from the next frame """
+    global LAYOUT
+    LAYOUT = GridLayout()
 
 
-async def _visualize_side_buttons(
-        lp: launchpad.LaunchpadPro, lvl_0_100: float,
+def visualize_audio_bands(
+        devices: list[LaunchpadDevice], bands_arr, timestamp: int | None = None, beat: bool = False,
+        balance: tuple[float, float] | None = None):
+    """
+    renders the bands on every device (bands are computed once, each device takes its slice),
+    `beat` -> there was a beat since the last frame, `balance` -> left/right shares (stereo analysis)
+    """
+    bands = np.asarray(bands_arr, dtype=np.float64)
+    for device in devices:
+        # the balance is measured on the SIDE_BANDS, only a slice starting with them (mirror layout,
+        # the first grid of the span layout) has them on its side columns, the other grids stay centered
+        device_balance = balance if (device.bands.start or 0) == SIDE_BANDS.start else None
+        render_device(device, bands[device.bands], timestamp, beat, device_balance)
+
+
+def render_device(
+        device: LaunchpadDevice, bands: np.ndarray, timestamp: int | None = None, beat: bool = False,
+        balance: tuple[float, float] | None = None):
+    global LAYOUT
+
+    vstate = device.vstate
+    if beat and CONFIG.beat.FLASH:
+        vstate.beat_level = 1.0
+
+    _visualize_pads(device.frame, LAYOUT, bands, round(vstate.beat_level * BEAT_STEPS))
+    # stereo: the left column follows the left channel, the right one the right channel
+    left_share, right_share = balance if balance is not None else (1.0, 1.0)
+    _visualize_side_buttons(
+        device.frame, vstate, LAYOUT, bands[0] * left_share, bands[1] * right_share,
+        bands[-4], bands[-2], bands[-1])
+    vstate.beat_level *= vstate.beat_decay
+
+    # the changed LEDs of the frame are written by the device output thread
+    device.output.submit(device.frame.diff(), timestamp)
+
+
+def _visualize_pads(frame: FrameBuffer, layout: GridLayout, bands: np.ndarray, beat_step: int = 0):
+    '''
+    band bars: the band level lights the pads of its column from the bottom, in the beat flash colors.
+    More bands than columns -> every column shows the loudest band of its group (no band is left out).
+    '''
+    columns = min(len(bands), CONFIG.pads.PADS_IN_COLUMN)
+    if len(bands) > columns:
+        bands = np.maximum.reduceat(bands, layout.column_starts(len(bands)))
+    levels = np.clip(np.rint(bands[:columns] * CONFIG.pads.PADS_IN_COLUMN), 0, CONFIG.pads.PADS_IN_COLUMN)
+
+    # pad_y is lit when it is within `level` pads from the bottom
+    lit = layout.pad_rows[:, None] >= (CONFIG.pads.PADS_IN_COLUMN + 1 - levels)[None, :]
+    frame.pixels[layout.pad_rows[0]:layout.pad_rows[-1] + 1, :columns] = np.where(
+        lit[:, :, None], layout.pad_beat_colors[beat_step][:, None, :], CONFIG.colors.MIN_VAL)
+
+
+def _visualize_side_buttons(
+        frame: FrameBuffer, vstate: VisualizerState, layout: GridLayout, lvl_0_100: float,
         lvl_100_200: float, lvl_800_1600: float, lvl_3200_6400: float, lvl_6400_22000: float):
     """
     Side button visualization with smooth color transitions based on bass level.
     """
-    global VSTATE, ALPHA_0_100, ALPHA_100_200, ALPHA_6400_22000, ALPHA_800_1600, VISUAL_SIDE_STATE_CACHE, CONFIG
-
     # 1. UPDATE THE SMOOTHED VALUES using the EMA
-    VSTATE.smoothed_0_100 = ALPHA_0_100 * lvl_0_100 + (1 - ALPHA_0_100) * VSTATE.smoothed_0_100
-    VSTATE.smoothed_100_200 = ALPHA_100_200 * lvl_100_200 + (1 - ALPHA_100_200) * VSTATE.smoothed_100_200
-    VSTATE.smoothed_800_1600 = ALPHA_800_1600 * lvl_800_1600 + (1 - ALPHA_800_1600) * VSTATE.smoothed_800_1600
-    VSTATE.smoothed_3200_6400 = ALPHA_800_1600 * lvl_3200_6400 + (1 - ALPHA_800_1600) * VSTATE.smoothed_3200_6400
-    VSTATE.smoothed_6400_22000 = ALPHA_6400_22000 * lvl_6400_22000 + (1 - ALPHA_6400_22000) * VSTATE.smoothed_6400_22000
-
-    # l - left, r - right, t - top, b - bottom
-    lr = lg = lb = CONFIG.colors.MIN_VAL
-    rr = rg = rb = CONFIG.colors.MIN_VAL
-    tr = tg = tb = CONFIG.colors.MIN_VAL
-    br = bg = bb = CONFIG.colors.MIN_VAL
-
-    # Logic for the left side
-    if VSTATE.smoothed_0_100 > CONFIG.threshold.LEFT_SUB:
-        start_rgb = CONFIG.colors.LEFT_START_RGB
-        end_rgb = CONFIG.colors.LEFT_END_RGB
-        # Using a smoothed value
-        lr = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * VSTATE.smoothed_0_100)
-        lg = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * VSTATE.smoothed_0_100)
-        lb = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * VSTATE.smoothed_0_100)
-    else:
-        lr, lg, lb = CONFIG.colors.OFF_COLOR_RGB
-
-    # Logic for the right side
-    if VSTATE.smoothed_100_200 > CONFIG.threshold.RIGHT_BASS:
-        start_rgb = CONFIG.colors.RIGHT_START_RGB
-        end_rgb = CONFIG.colors.RIGHT_END_RGB
-        # Using a smoothed value
-        rr = int(start_rgb[0] + (end_rgb[0] - start_rgb[0]) * VSTATE.smoothed_100_200)
-        rg = int(start_rgb[1] + (end_rgb[1] - start_rgb[1]) * VSTATE.smoothed_100_200)
-        rb = int(start_rgb[2] + (end_rgb[2] - start_rgb[2]) * VSTATE.smoothed_100_200)
-    else:
-        rr, rg, rb = CONFIG.colors.OFF_COLOR_RGB
-
-    # 2. CACHING AND UPDATING LEDS
-
-    # Left side buttons
-    if CONFIG.pads.TURN_ON_LEFT_BUTTONS:
-        for y in range(CONFIG.pads.LEFT_Y_RANGE[0], CONFIG.pads.LEFT_Y_RANGE[1]):
-            current_color = (lr, lg, lb)
-            cache_index = y - 1
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(CONFIG.pads.LEFT_X_POS, y, lr, lg, lb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
-
-    # Right side buttons
-    if CONFIG.pads.TURN_ON_RIGHT_BUTTONS:
-        for y in range(CONFIG.pads.RIGHT_Y_RANGE[0], CONFIG.pads.RIGHT_Y_RANGE[1]):
-            current_color = (rr, rg, rb)
-            cache_index = VSSCACHE_RIGHT_INDEX + (y - 1)
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(CONFIG.pads.RIGHT_X_POS, CONFIG.pads.PADS_IN_COLUMN - y + 1, rr, rg, rb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
+    levels = np.array((lvl_0_100, lvl_100_200, lvl_800_1600, lvl_3200_6400, lvl_6400_22000))
+    smoothed = vstate.smoothed
+    smoothed += vstate.alphas * (levels - smoothed)
 
-    # Top buttons
-    if CONFIG.pads.TURN_ON_TOP_BUTTONS:
-        # split range into left and right halves
-        left_range = list(range(CONFIG.pads.TOP_X_RANGE[0], (CONFIG.pads.TOP_X_RANGE[0] + CONFIG.pads.TOP_X_RANGE[1]) // 2))
-        right_range = reversed(list(range((CONFIG.pads.TOP_X_RANGE[0] + CONFIG.pads.TOP_X_RANGE[1]) // 2, CONFIG.pads.TOP_X_RANGE[1])))
+    # quantized intensities -> color tables indexes
+    lut_index = _lut_index(smoothed)
 
-        left_intensity = VSTATE.smoothed_800_1600
-        right_intensity = VSTATE.smoothed_3200_6400
-        thresholds = CONFIG.threshold.SIDE_HALF_THRESHOLD
+    pads = CONFIG.pads
+    pixels = frame.pixels
 
-        # --- LEFT (example: green-blue tones) ---
-        for i, x in enumerate(left_range):
-            threshold = thresholds[i % len(thresholds)]
-            if left_intensity >= threshold:
-                tr = int(CONFIG.colors.MAX_VAL * (0.3 * left_intensity))
-                tg = int(CONFIG.colors.MAX_VAL * (0.7 * left_intensity))
-                tb = int(CONFIG.colors.MAX_VAL * (0.8 * left_intensity))
-            else:
-                tr = tg = tb = CONFIG.colors.MIN_VAL
-
-            current_color = (tr, tg, tb)
-            cache_index = VSSCACHE_TOP_INDEX + x
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(x, CONFIG.pads.TOP_Y_POS, tr, tg, tb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
-
-        # --- RIGHT (example: purple-pink tones) ---
-        for i, x in enumerate(right_range):
-            threshold = thresholds[i % len(thresholds)]
-            if right_intensity >= threshold:
-                tr = int(CONFIG.colors.MAX_VAL * (0.8 * right_intensity))
-                tg = int(CONFIG.colors.MAX_VAL * (0.3 * right_intensity))
-                tb = int(CONFIG.colors.MAX_VAL * (0.7 * right_intensity))
-            else:
-                tr = tg = tb = CONFIG.colors.MIN_VAL
-
-            current_color = (tr, tg, tb)
-            cache_index = VSSCACHE_TOP_INDEX + x
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(x, CONFIG.pads.TOP_Y_POS, tr, tg, tb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
+    # 2. RENDER INTO THE FRAME (the frame diff takes care of the unchanged LEDs)
 
-    # Bottom buttons
-    # Bottom buttons (split into left and right halves)
-    if CONFIG.pads.TURN_ON_BOTTOM_BUTTONS:
-        mid_range = list(range(CONFIG.pads.BOTTOM_X_RANGE[0], (CONFIG.pads.BOTTOM_X_RANGE[0] + CONFIG.pads.BOTTOM_X_RANGE[1]) // 2))
-        high_range = reversed(list(range((CONFIG.pads.BOTTOM_X_RANGE[0] + CONFIG.pads.BOTTOM_X_RANGE[1]) // 2, CONFIG.pads.BOTTOM_X_RANGE[1])))
+    # Left side buttons (sub bass gradient)
+    if pads.TURN_ON_LEFT_BUTTONS:
+        pixels[layout.left_rows, pads.LEFT_X_POS] = layout.left_lut[lut_index[SMOOTHED_0_100]]
 
-        mid_intensity = VSTATE.smoothed_3200_6400
-        thresholds = CONFIG.threshold.SIDE_HALF_THRESHOLD
+    # Right side buttons (bass gradient)
+    if pads.TURN_ON_RIGHT_BUTTONS:
+        pixels[layout.right_rows, pads.RIGHT_X_POS] = layout.right_lut[lut_index[SMOOTHED_100_200]]
+
+    # Top buttons
+    if pads.TURN_ON_TOP_BUTTONS:
+        pixels[pads.TOP_Y_POS, layout.top_xs] = layout.top_lut[layout.top_buttons, lut_index[layout.top_sources]]
+
+    # Bottom buttons
+    if pads.TURN_ON_BOTTOM_BUTTONS:
+        pixels[pads.BOTTOM_Y_POS, layout.bottom_xs] = layout.bottom_lut[
+            layout.bottom_buttons, lut_index[layout.bottom_sources]]
 
-        for i, x in enumerate(mid_range):
-            threshold = thresholds[i]
-            if mid_intensity >= threshold:
-                br = int(CONFIG.colors.MAX_VAL * mid_intensity)
-                bg = int(CONFIG.colors.MAX_VAL * mid_intensity * 0.6)
-                bb = 0
-            else:
-                br = bg = bb = CONFIG.colors.MIN_VAL
-
-            current_color = (br, bg, bb)
-            cache_index = VSSCACHE_BOTTOM_INDEX + x
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(x, CONFIG.pads.BOTTOM_Y_POS, br, bg, bb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
-
-        # --- RIGHT (high = hats/sibilants) ---
-        high_intensity = VSTATE.smoothed_6400_22000
-        thresholds = CONFIG.threshold.SIDE_HALF_THRESHOLD
 
-        for i, x in enumerate(high_range):
-            threshold = thresholds[i]
-            if high_intensity >= threshold:
-                br = int(CONFIG.colors.MAX_VAL * high_intensity * 0.4)
-                bg = int(CONFIG.colors.MAX_VAL * high_intensity * 0.5)
-                bb = int(CONFIG.colors.MAX_VAL * high_intensity)
-            else:
-                br = bg = bb = CONFIG.colors.MIN_VAL
-            current_color = (br, bg, bb)
-            cache_index = VSSCACHE_BOTTOM_INDEX + x
-            if VISUAL_SIDE_STATE_CACHE[cache_index] != current_color:
-                lp.LedCtrlXY(x, CONFIG.pads.BOTTOM_Y_POS, br, bg, bb)
-                VISUAL_SIDE_STATE_CACHE[cache_index] = current_color
+def _lut_index(intensity: np.ndarray) -> np.ndarray:
+    ''' 0..1 intensities -> LUT rows '''
+    return np.rint(np.clip(intensity, 0.0, 1.0) * (LUT_LEVELS - 1)).astype(np.intp)
@@ -0,0 +1,93 @@
+import numpy as np
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+# Launchpad Pro "set LEDs RGB" SysEx: F0 00 20 29 02 10 0B <led> <r> <g> <b> [<led> <r> <g> <b> ...] F7
+SYSEX_SET_RGB_HEADER = [0, 32, 41, 2, 16, 11]
+# "set all LEDs" to the palette color 0: F0 00 20 29 02 10 0E 00 F7
+SYSEX_ALL_OFF = bytes((SYSEX_START, 0, 32, 41, 2, 16, 14, 0, SYSEX_END))
+# "select mode" Ableton Live (the grid takes the LED messages), sent by launchpad_py on open: F0 00 20 29 02 10 21 00 F7
+SYSEX_LIVE_MODE = bytes((SYSEX_START, 0, 32, 41, 2, 16, 33, 0, SYSEX_END))
+# max LEDs in one "set LEDs RGB" message
+SYSEX_MAX_LEDS = 78
+# the Launchpad Pro RGB range
+LED_MAX_VAL = 63
+# the whole grid with the side buttons, 10x10 in launchpad_py XY coordinates
+GRID_SIZE = 10
+
+
+# the encoded (led, r, g, b) parts are cached up to this many distinct LED colors, then the cache starts over
+MAX_CACHED_COLORS = 16384
+
+
+def xy_to_led(x: int, y: int) -> int:
+    """ launchpad_py "classic" XY coordinates (as in LedCtrlXY) to the Launchpad Pro LED number """
+    return 90 - 10 * y + (x + 1) % 10
+
+
+# LED number of every [y, x] of the grid, the side buttons (PadsConfig.*_POS) included
+LED_NUMBERS = np.array([[xy_to_led(x, y) for x in range(GRID_SIZE)] for y in range(GRID_SIZE)], dtype=np.uint8)
+
+
+class FrameBuffer:
+    """
+    The whole launchpad grid as one (10, 10, 3) uint8 array indexed as [y, x] (LedCtrlXY coordinates).
+
+    `pixels` is the frame being rendered, `shadow` is what the device shows,
+    `diff()` finds the changed LEDs with one array comparison.
+    """
+
+    def __init__(self):
+        self.pixels = np.zeros((GRID_SIZE, GRID_SIZE, 3), dtype=np.uint8)
+        self.shadow = np.zeros_like(self.pixels)
+        self.leds = LED_NUMBERS
+
+    def diff(self) -> dict:
+        """ returns the changed LEDs (led -> color) and marks them as sent """
+        changed = np.any(self.pixels != self.shadow, axis=2)
+        if not changed.any():
+            return {}
+
+        colors = self.pixels[changed]
+        self.shadow[changed] = colors
+        return dict(zip(self.leds[changed].tolist(), map(tuple, colors.tolist())))
+
+    def clear(self):
+        """ everything off, call it after lp.Reset() """
+        self.pixels.fill(0)
+        self.shadow.fill(0)
+
+
+class SysExEncoder:
+    """
+    Encodes the frame diffs (led -> color) into complete raw "set LEDs RGB" SysEx messages (F0 ... F7),
+    ready for a single MIDI write each, no per-LED work in the MIDI library.
+
+    The colors come from the lookup tables, so the same (led, color) pairs repeat from frame to frame:
+    their 4 encoded bytes are cached and a message is one join of the cached parts.
+    """
+
+    def __init__(self, max_cached: int = MAX_CACHED_COLORS):
+        self.max_cached = max_cached
+        self._header = bytes((SYSEX_START, *SYSEX_SET_RGB_HEADER))
+        self._end = bytes((SYSEX_END,))
+        self._parts = {}
+
+    def encode(self, leds: dict) -> list[bytes]:
+        """ up to SYSEX_MAX_LEDS LEDs per message """
+        parts = self._parts
+        if len(parts) > self.max_cached:
+            parts.clear()
+
+        items = list(leds.items())
+        messages = []
+        for i in range(0, len(items), SYSEX_MAX_LEDS):
+            chunk = []
+            for item in items[i:i + SYSEX_MAX_LEDS]:
+                part = parts.get(item)
+                if part is None:
+                    led, (r, g, b) = item
+                    part = parts[item] = bytes((led, r, g, b))
+                chunk.append(part)
+            messages.append(self._header + b"".join(chunk) + self._end)
+        return messages
@@ -0,0 +1,197 @@
+import threading
+import time
+from launchpad_py import launchpad
+from core.led_frame import SYSEX_ALL_OFF, SYSEX_LIVE_MODE, SysExEncoder
+from utils.logger import HOT_LOGGER
+from utils.metrics import METRICS
+
+# smoothing of the flush time, per written frame
+FLUSH_EMA_ALPHA = 0.2
+
+
+class LaunchpadPyWriter:
+    """ writes the raw SysEx messages through launchpad_py (the fallback when rtmidi can't open the port) """
+
+    def __init__(self, lp: launchpad.LaunchpadPro):
+        self.lp = lp
+
+    def send(self, messages: list[bytes]) -> int:
+        for message in messages:
+            # launchpad_py adds F0 and F7 itself
+            self.lp.midi.RawWriteSysEx(list(message[1:-1]))
+        return len(messages)
+
+    def reset(self):
+        self.lp.Reset()
+
+    def close(self):
+        pass
+
+
+class RtMidiWriter:
+    """
+    Writes the raw SysEx messages straight to the output port, one python-rtmidi call per message.
+
+    The port may be unplugged and plugged back (core.midi_ports.PortMonitor swaps the MidiOut):
+    while it is gone the messages are dropped.
+    """
+
+    def __init__(self, midi_out, port_name: str):
+        self.midi_out = midi_out
+        self.port_name = port_name
+        self.connected = True
+        self._lock = threading.Lock()
+
+    def send(self, messages: list[bytes]) -> int:
+        with self._lock:
+            if not self.connected:
+                return 0
+            for message in messages:
+                self.midi_out.send_message(message)
+        return len(messages)
+
+    def reset(self):
+        with self._lock:
+            if self.connected:
+                self.midi_out.send_message(SYSEX_ALL_OFF)
+
+    def select_mode(self):
+        """ a grid left in the standalone mode ignores the LED messages, launchpad_py does the same on open """
+        with self._lock:
+            if self.connected:
+                self.midi_out.send_message(SYSEX_LIVE_MODE)
+
+    def disconnect(self):
+        with self._lock:
+            if self.connected:
+                self.connected = False
+                self.midi_out.close_port()
+
+    def reconnect(self, midi_out, port_name: str):
+        """ the port is back (maybe under a new ALSA client number), `midi_out` is already opened """
+        with self._lock:
+            self.midi_out = midi_out
+            self.port_name = port_name
+            self.connected = True
+
+    def close(self):
+        self.disconnect()
+
+
+class MidiOutputWorker:
+    """
+    Writes the LED frames to the launchpad from a dedicated thread.
+
+    The mailbox keeps only the latest color per LED: when the device is slower than the frames,
+    stale colors are overwritten (coalesced) instead of queued, and `submit` never waits for MIDI I/O.
+    The diffs are encoded into raw SysEx messages and written by `writer` (launchpad_py when it is None).
+    """
+
+    def __init__(self, lp: launchpad.LaunchpadPro | None, writer: RtMidiWriter | LaunchpadPyWriter | None = None):
+        self.lp = lp
+        self.writer = writer if writer is not None else LaunchpadPyWriter(lp)
+        self.encoder = SysExEncoder()
+        self._mailbox = {}
+        # perf_counter_ns when the audio of the newest frame in the mailbox was captured
+        self._mailbox_timestamp = None
+        self._reset_requested = False
+        # everything written since the last reset (led -> color), sent again after a reconnect
+        self._shown = {}
+        self._redraw_requested = False
+        self._running = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # stats, coalesced -> frames merged into a newer one before they were written
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_coalesced = 0
+        self.messages_written = 0
+        self._frames_taken = 0
+        # smoothed time of one frame write (ns), the frame scheduler adapts the refresh rate to it
+        self.flush_ns = 0.0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="midi-output", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0, reset: bool = False):
+        """ writes what is left in the mailbox, stops the thread and closes the port (`reset` -> all LEDs off first) """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if reset:
+            self.writer.reset()
+        self.writer.close()
+
+    def submit(self, leds: dict, timestamp: int | None = None):
+        """
+        puts the frame diff (led -> color) into the mailbox, newer colors win.
+        `timestamp` is perf_counter_ns of the frame audio, it is used for the audio-to-light latency.
+        """
+        if not leds:
+            return
+        with self._cond:
+            self._mailbox.update(leds)
+            self._mailbox_timestamp = timestamp
+            self.frames_submitted += 1
+            self._cond.notify()
+
+    def reset(self):
+        """ drops the pending colors and resets the launchpad from the writer thread (keeps MIDI writes in order) """
+        with self._cond:
+            self._mailbox.clear()
+            self._frames_taken = self.frames_submitted
+            self._reset_requested = True
+            self._cond.notify()
+
+    def redraw(self):
+        """ writes the whole shown frame again (the device was plugged back and came up dark) """
+        with self._cond:
+            self._redraw_requested = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._mailbox and not self._reset_requested and not self._redraw_requested:
+                    self._cond.wait()
+
+                if not self._running and not self._mailbox and not self._reset_requested:
+                    return
+
+                leds, self._mailbox = self._mailbox, {}
+                timestamp, self._mailbox_timestamp = self._mailbox_timestamp, None
+                reset, self._reset_requested = self._reset_requested, False
+                redraw, self._redraw_requested = self._redraw_requested, False
+                batch = self.frames_submitted - self._frames_taken
+                self._frames_taken = self.frames_submitted
+
+            try:
+                if reset:
+                    self._shown.clear()
+                    self.writer.reset()
+                if redraw:
+                    leds = {**self._shown, **leds}
+                if leds:
+                    self._shown.update(leds)
+                    write_start = time.perf_counter_ns()
+                    self.messages_written += self.writer.send(self.encoder.encode(leds))
+                    write_end = time.perf_counter_ns()
+                    self.frames_written += 1
+                    self.frames_coalesced += max(batch - 1, 0)
+                    self.flush_ns += FLUSH_EMA_ALPHA * (write_end - write_start - self.flush_ns)
+
+                    METRICS.record("midi", write_end - write_start)
+                    if timestamp is not None:
+                        METRICS.record("latency", write_end - timestamp)
+                    METRICS.count("frames_written")
+                    if batch > 1:
+                        METRICS.count("frames_dropped", batch - 1)
+            except Exception:
+                # a broken device fails every frame, the traceback is logged once per interval
+                HOT_LOGGER.log("ERROR", "midi output", "MIDI output failed.", exception=True)
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import threading
+from core.config import CONFIG
+from core.midi_output import MidiOutputWorker, RtMidiWriter
+from utils.logger import logger
+
+# ALSA appends "client:port" numbers to the port names, they change when the device is plugged back
+_ALSA_NUMBERS = re.compile(r"\s+(\d+):\d+$")
+
+
+def port_identity(port_name: str) -> str:
+    """ the port name without the parts that change between connections """
+    return _ALSA_NUMBERS.sub("", port_name)
+
+
+def port_keys(port_names: list[str]) -> list[tuple[str, int]]:
+    """
+    (identity, occurrence) of every port: identical grids have the same identity,
+    the occurrence tells them apart (their order by the ALSA client number, by the listing order elsewhere)
+    """
+    identities = [port_identity(port_name) for port_name in port_names]
+    keys = [None] * len(port_names)
+    for identity in set(identities):
+        same = [i for i, other in enumerate(identities) if other == identity]
+        same.sort(key=lambda i: (_alsa_client(port_names[i]), i))
+        for occurrence, i in enumerate(same):
+            keys[i] = (identity, occurrence)
+    return keys
+
+
+def _alsa_client(port_name: str) -> int:
+    match = _ALSA_NUMBERS.search(port_name)
+    return int(match.group(1)) if match else -1
+
+
+def match_midi_ports(port_names: list[str], name: str, skip: tuple[str, ...] = ()) -> list[int]:
+    """ indexes of the ports whose name contains `name` and none of `skip` """
+    return [
+        i for i, port_name in enumerate(port_names)
+        if name in port_name and not any(part in port_name for part in skip)
+    ]
+
+
+class PortCache:
+    """
+    last known ports of the grids, kept in a JSON file: rtmidi port keys ([identity, occurrence], see `port_keys`)
+    and launchpad_py port numbers
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self.rtmidi = []
+        self.launchpad_py = []
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            self.rtmidi = [(str(identity), int(occurrence)) for identity, occurrence in data.get("rtmidi", [])]
+            self.launchpad_py = [int(port) for port in data.get("launchpad_py", [])]
+        except (OSError, ValueError, TypeError, AttributeError):
+            # no cache yet or a broken one -> full discovery
+            self.rtmidi = []
+            self.launchpad_py = []
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as file:
+                json.dump({"rtmidi": [list(key) for key in self.rtmidi], "launchpad_py": self.launchpad_py}, file, indent=2)
+        except OSError as e:
+            logger.warning(f"The ports cache {self.path} can't be saved: {e}")
+
+
+def resolve_ports(port_names: list[str], count: int, cached: list[tuple[str, int]] = ()) -> list[int]:
+    """
+    indexes of the grid ports in `port_names`: the cached port keys first (the grids keep their order),
+    then the other ports matching DevicesConfig.MIDI_PORT_*
+    """
+    devices = CONFIG.devices
+    keys = port_keys(port_names)
+    resolved = []
+    for key in cached:
+        key = tuple(key)
+        if key in keys and keys.index(key) not in resolved:
+            resolved.append(keys.index(key))
+    resolved = resolved[:count]
+    for port in match_midi_ports(port_names, devices.MIDI_PORT_NAME, devices.MIDI_PORT_SKIP):
+        if len(resolved) >= count:
+            break
+        if port not in resolved:
+            resolved.append(port)
+    return resolved
+
+
+def open_rtmidi_writers(count: int, cache: PortCache) -> list[RtMidiWriter]:
+    """ one port names enumeration, opens up to `count` grids; [] -> no rtmidi or no grid found (use launchpad_py) """
+    try:
+        import rtmidi
+    except ImportError:
+        logger.warning("python-rtmidi is not installed, the grids are opened through launchpad_py.")
+        return []
+
+    port_names = rtmidi.MidiOut().get_ports()
+    keys = port_keys(port_names)
+    writers = []
+    opened = []
+    for port in resolve_ports(port_names, count, cache.rtmidi):
+        midi_out = rtmidi.MidiOut()
+        try:
+            midi_out.open_port(port)
+        except Exception:
+            logger.exception(f"rtmidi can't open {port_names[port]!r}.")
+            continue
+        logger.info(f"Grid {len(writers)} is {port_names[port]!r} (rtmidi).")
+        writer = RtMidiWriter(midi_out, port_names[port])
+        writer.select_mode()
+        writers.append(writer)
+        opened.append(keys[port])
+
+    if writers:
+        cache.rtmidi = opened
+        cache.save()
+    return writers
+
+
+class PortMonitor:
+    """
+    Hot-plug in a background thread: every `interval` seconds the port names are listed (no device I/O),
+    the writers of unplugged grids are closed and reopened when their port is back, then the grid is redrawn.
+    The capture, the analysis and the other grids keep running.
+    """
+
+    def __init__(self, outputs: list[MidiOutputWorker], interval: float = 1.0):
+        # only the rtmidi outputs can be reopened
+        self.outputs = [output for output in outputs if isinstance(output.writer, RtMidiWriter)]
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._rtmidi = None
+        self._probe = None
+
+    def start(self):
+        import rtmidi
+        self._rtmidi = rtmidi
+        self._probe = rtmidi.MidiOut()
+        self._thread = threading.Thread(target=self._run, name="midi-hotplug", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("MIDI hot-plug check failed.")
+
+    def check(self):
+        port_names = self._probe.get_ports()
+        # every port is held by one grid at most: identical grids differ only by the full (ALSA numbered) name
+        taken = set()
+        for output in self.outputs:
+            writer = output.writer
+            if not writer.connected:
+                continue
+            port = self._free_port(port_names, taken, lambda name: name == writer.port_name)
+            if port is not None:
+                taken.add(port)
+            else:
+                logger.warning(f"{writer.port_name!r} is gone, waiting for it to come back.")
+                writer.disconnect()
+
+        for output in self.outputs:
+            writer = output.writer
+            if writer.connected:
+                continue
+            identity = port_identity(writer.port_name)
+            # the same ALSA numbers first, then any free port of an identical grid
+            port = self._free_port(port_names, taken, lambda name: name == writer.port_name)
+            if port is None:
+                port = self._free_port(port_names, taken, lambda name: port_identity(name) == identity)
+            if port is None:
+                continue
+            midi_out = self._rtmidi.MidiOut()
+            midi_out.open_port(port)
+            writer.reconnect(midi_out, port_names[port])
+            writer.select_mode()
+            taken.add(port)
+            output.redraw()
+            logger.info(f"{port_names[port]!r} is back.")
+
+    @staticmethod
+    def _free_port(port_names: list[str], taken: set, matches) -> int | None:
+        for port, port_name in enumerate(port_names):
+            if port not in taken and matches(port_name):
+                return port
+        return None
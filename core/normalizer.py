@@ -0,0 +1,75 @@
+import numpy as np
+
+# slow EMA below it counts as silence (no division)
+SLOW_EMA_FLOOR = 1e-6
+
+
+class BandNormalizer:
+    """
+    Band RMS -> brightness 0..1: psychoacoustic weights, fast/slow EMA ratio, tanh compression,
+    noise gate and neighbor smoothing.
+
+    All the state and the intermediate arrays are preallocated, a frame is processed in place.
+    One instance per stream, the returned array is reused by the next call.
+    """
+
+    def __init__(self, weights, fast_alpha: float, slow_alpha: float, noise_gate: float = 0.08):
+        self.weights = np.array(weights, dtype=np.float64)
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.noise_gate = noise_gate
+
+        bands = len(self.weights)
+        self.fast = np.zeros(bands, dtype=np.float64)
+        self.slow = np.zeros(bands, dtype=np.float64)
+
+        self._weighted = np.empty(bands, dtype=np.float64)
+        self._delta = np.empty(bands, dtype=np.float64)
+        self._ratio = np.empty(bands, dtype=np.float64)
+        self._gated = np.empty(bands, dtype=bool)
+        self._valid = np.empty(bands, dtype=bool)
+        self._brightness = np.empty(bands, dtype=np.float64)
+
+    @property
+    def bands_count(self) -> int:
+        return len(self.weights)
+
+    def process(self, bands_rms: np.ndarray) -> np.ndarray:
+        weighted = self._weighted
+        np.multiply(bands_rms, self.weights, out=weighted)
+
+        # EMA: value += alpha * (new - value)
+        self._update_ema(self.fast, weighted, self.fast_alpha)
+        self._update_ema(self.slow, weighted, self.slow_alpha)
+
+        # Protection from division by zero + normalization
+        ratio = self._ratio
+        ratio.fill(0.0)
+        np.greater_equal(self.slow, SLOW_EMA_FLOOR, out=self._valid)
+        np.divide(self.fast, self.slow, out=ratio, where=self._valid)
+        np.tanh(ratio, out=ratio)
+
+        # Hard threshold for noise
+        np.less(ratio, self.noise_gate, out=self._gated)
+        np.copyto(ratio, 0.0, where=self._gated)
+
+        # Simple smoothing of adjacent bands: 0.5 * band + 0.25 * (left + right)
+        brightness = self._brightness
+        brightness[:] = ratio
+        if len(ratio) > 2:
+            inner = brightness[1:-1]
+            np.add(ratio[:-2], ratio[2:], out=inner)
+            inner *= 0.5
+            inner += ratio[1:-1]
+            inner *= 0.5
+
+        return brightness
+
+    def _update_ema(self, ema: np.ndarray, values: np.ndarray, alpha: float):
+        np.subtract(values, ema, out=self._delta)
+        self._delta *= alpha
+        ema += self._delta
+
+    def reset(self):
+        self.fast.fill(0.0)
+        self.slow.fill(0.0)
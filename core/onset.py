@@ -0,0 +1,162 @@
+import math
+import numpy as np
+from core.config import CONFIG
+from core.spectrum import SpectralAnalyzer
+
+# flux threshold = THRESHOLD * running mean of the flux + MIN_FLUX
+MIN_FLUX = 0.01
+# autocorrelation peak (relative to the zero lag) below it -> no stable tempo
+MIN_TEMPO_CONFIDENCE = 0.1
+# after the last onset the beat keeps going for this many periods (short breaks, offbeat-only bars)
+FLYWHEEL_BEATS = 4
+
+
+class OnsetDetector:
+    """
+    Streaming spectral-flux onset detector and autocorrelation tempo tracker.
+
+    Runs on the power spectrum the analyzer has already computed for the window (no second FFT),
+    one `process` call per hop. Flux = mean positive change of the log magnitude between hops,
+    an onset is a local flux peak above the adaptive threshold. The tempo comes from
+    the autocorrelation of the flux history, beats follow the onsets and keep the tempo between them.
+    """
+
+    def __init__(
+            self, analyzer: SpectralAnalyzer, hop_size: int, threshold: float = 1.5,
+            mean_seconds: float = 1.0, min_interval: float = 0.1, bpm_range=(60.0, 200.0),
+            history_seconds: float = 6.0, tempo_interval: float = 0.5):
+        self.analyzer = analyzer
+        self.hop_size = hop_size
+        self.hop_rate = analyzer.samplerate / hop_size
+        self.threshold = threshold
+        self.mean_alpha = 1.0 - math.exp(-1.0 / (mean_seconds * self.hop_rate))
+        self.min_interval_hops = max(1, round(min_interval * self.hop_rate))
+        self.tempo_interval_hops = max(1, round(tempo_interval * self.hop_rate))
+
+        # tempo lags (hops) for the BPM range
+        min_bpm, max_bpm = bpm_range
+        self.min_lag = max(1, math.floor(60.0 * self.hop_rate / max_bpm))
+        self.max_lag = math.ceil(60.0 * self.hop_rate / min_bpm)
+
+        bins = len(analyzer.freqs)
+        self._log_mag = np.zeros(bins, dtype=np.float64)
+        self._prev_log_mag = np.zeros(bins, dtype=np.float64)
+        self._diff = np.empty(bins, dtype=np.float64)
+
+        # flux history for the tempo, circular
+        self._history = np.zeros(max(round(history_seconds * self.hop_rate), 2 * self.max_lag + 1), dtype=np.float64)
+        self._fft_size = 1 << (2 * len(self._history) - 1).bit_length()
+
+        self.reset()
+
+    def reset(self):
+        self._log_mag.fill(0.0)
+        self._prev_log_mag.fill(0.0)
+        self._history.fill(0.0)
+        self._hop = 0
+        self._flux_mean = 0.0
+        # flux of the last two hops, the peak is picked one hop late
+        self._flux_prev = 0.0
+        self._flux_prev2 = 0.0
+        self._last_onset = -self.min_interval_hops
+        self._last_beat = None
+        self.period = 0.0
+
+        # results of the last `process` call
+        self.flux = 0.0
+        self.onset = False
+        self.beat = False
+
+    @property
+    def bpm(self) -> float:
+        """ 0.0 -> no stable tempo yet """
+        return 60.0 * self.hop_rate / self.period if self.period else 0.0
+
+    def process(self) -> bool:
+        """ consumes the spectrum of the last analyzed window, returns True on a beat """
+        # log compression, so quiet and loud parts give comparable flux
+        self._log_mag, self._prev_log_mag = self._prev_log_mag, self._log_mag
+        log_mag, prev = self._log_mag, self._prev_log_mag
+        np.sqrt(self.analyzer.power, out=log_mag)
+        np.log1p(log_mag, out=log_mag)
+
+        diff = self._diff
+        np.subtract(log_mag, prev, out=diff)
+        np.maximum(diff, 0.0, out=diff)
+        flux = float(diff.mean())
+
+        self._history[self._hop % len(self._history)] = flux
+        self._hop += 1
+        self.flux = flux
+
+        # peak picking on the previous hop: above the threshold and the local maximum
+        peak_hop = self._hop - 2
+        candidate = self._flux_prev
+        self.onset = (
+            candidate > self.threshold * self._flux_mean + MIN_FLUX
+            and candidate >= self._flux_prev2
+            and candidate > flux
+            and peak_hop - self._last_onset >= self.min_interval_hops
+        )
+        if self.onset:
+            self._last_onset = peak_hop
+        self._flux_mean += self.mean_alpha * (flux - self._flux_mean)
+        self._flux_prev2, self._flux_prev = self._flux_prev, flux
+
+        if self._hop % self.tempo_interval_hops == 0:
+            self._update_tempo()
+
+        self.beat = self._track_beat(peak_hop)
+        return self.beat
+
+    def _track_beat(self, now: int) -> bool:
+        if self.onset:
+            # an onset re-syncs the beat unless it's an offbeat right after the last beat
+            if not self.period or self._last_beat is None or now - self._last_beat > 0.5 * self.period:
+                self._last_beat = now
+                return True
+            return False
+
+        if self.period and self._last_beat is not None:
+            if now - self._last_beat >= self.period and now - self._last_onset <= FLYWHEEL_BEATS * self.period:
+                self._last_beat += self.period
+                return True
+        return False
+
+    def _update_tempo(self):
+        """ the strongest autocorrelation lag of the flux history within the BPM range """
+        size = len(self._history)
+        if self._hop < size:
+            return
+
+        # oldest value first
+        start = self._hop % size
+        history = np.concatenate((self._history[start:], self._history[:start]))
+        history -= history.mean()
+
+        spectrum = np.fft.rfft(history, self._fft_size)
+        autocorr = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, self._fft_size)[:self.max_lag + 2]
+        if autocorr[0] <= 0.0:
+            self.period = 0.0
+            return
+
+        lags = autocorr[self.min_lag:self.max_lag + 1]
+        best = int(np.argmax(lags)) + self.min_lag
+        if autocorr[best] < MIN_TEMPO_CONFIDENCE * autocorr[0]:
+            self.period = 0.0
+            return
+
+        # parabolic interpolation between the neighbor lags
+        left, center, right = autocorr[best - 1], autocorr[best], autocorr[best + 1]
+        denominator = left - 2.0 * center + right
+        offset = 0.5 * (left - right) / denominator if denominator else 0.0
+        self.period = best + float(np.clip(offset, -0.5, 0.5))
+
+
+def create_onset_detector(analyzer: SpectralAnalyzer, hop_size: int) -> OnsetDetector | None:
+    """ detector with the BeatConfig settings, None when the beat detection is off """
+    beat = CONFIG.beat
+    if not beat.ENABLED:
+        return None
+    return OnsetDetector(
+        analyzer, hop_size, beat.THRESHOLD, beat.MEAN_SECONDS, beat.MIN_INTERVAL, beat.BPM_RANGE)
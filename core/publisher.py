@@ -0,0 +1,236 @@
+import asyncio
+import os
+import socket
+import stat
+import struct
+import time
+import numpy as np
+from utils.logger import logger, HOT_LOGGER
+from utils.metrics import METRICS
+
+# sent once to every new subscriber: magic, protocol version
+HELLO = struct.Struct("<4sH")
+MAGIC = b"LPVB"
+PROTOCOL_VERSION = 1
+# every frame: sequence number, timestamp (ns), flags, bands count, left/right balance, then the bands (<f8)
+FRAME_HEADER = struct.Struct("<QqBH2d")
+BAND_DTYPE = np.dtype("<f8")
+
+# frame flags
+FLAG_BEAT = 1
+# the balance comes from the stereo analysis (otherwise it is 1.0, 1.0)
+FLAG_STEREO = 2
+
+
+class _Subscriber(asyncio.Protocol):
+    """ one connected subscriber, the frames it can't take in time are dropped """
+
+    def __init__(self, publisher: "BandPublisher"):
+        self.publisher = publisher
+        self.transport = None
+        self.dropped = 0
+        # frame size the socket send buffer is sized for
+        self._frame_size = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(HELLO.pack(MAGIC, PROTOCOL_VERSION))
+        self.publisher.subscribers.append(self)
+        logger.info(f"Band subscriber connected ({len(self.publisher.subscribers)} in total).")
+
+    def connection_lost(self, exc):
+        if self in self.publisher.subscribers:
+            self.publisher.subscribers.remove(self)
+        logger.info(f"Band subscriber disconnected, {self.dropped} frames dropped for it.")
+
+    def data_received(self, data):
+        # the stream is one way, anything sent by the subscriber is ignored
+        pass
+
+    def send(self, frame: bytes, max_pending: int) -> bool:
+        if len(frame) != self._frame_size:
+            self._frame_size = len(frame)
+            self._size_send_buffer(max_pending * len(frame))
+        # the socket buffer holds the pending frames, once it is full the transport would start buffering
+        # in the process instead: the subscriber is behind, it skips the frame
+        if self.transport.is_closing() or self.transport.get_write_buffer_size():
+            self.dropped += 1
+            return False
+        self.transport.write(frame)
+        return True
+
+    def _size_send_buffer(self, size: int):
+        # the kernel rounds it up to its minimum (a few KB, several small frames)
+        sock = self.transport.get_extra_info("socket")
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+        except OSError as e:
+            logger.warning(f"The subscriber socket buffer can't be resized: {e}")
+
+
+class BandPublisher:
+    """
+    Streams the analyzed band frames to local subscribers over a Unix domain socket,
+    so other tools (DMX bridge, preview, recorders) share one capture and one FFT.
+
+    Runs on the event loop of the analysis, `publish` never waits for a subscriber: every frame
+    is written to the socket buffers once. The send buffer of every subscriber socket is sized for `max_pending`
+    frames (at least the kernel minimum), a subscriber whose buffer is full drops the new frames
+    (it sees the gap in the sequence numbers).
+    """
+
+    def __init__(self, path: str, max_pending: int = 4):
+        self.path = path
+        self.max_pending = max_pending
+        self.subscribers: list[_Subscriber] = []
+        self.sequence = 0
+        self.frames_dropped = 0
+        self._server = None
+
+    async def start(self) -> bool:
+        """ False -> Unix sockets are not supported here (Windows event loop), nothing is published """
+        _remove_stale_socket(self.path)
+        try:
+            self._server = await asyncio.get_running_loop().create_unix_server(lambda: _Subscriber(self), self.path)
+        except (NotImplementedError, AttributeError):
+            logger.warning("Unix domain sockets are not supported on this platform, band frames are not published.")
+            return False
+        logger.info(f"Publishing band frames on {self.path}.")
+        return True
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for subscriber in list(self.subscribers):
+            # a stalled subscriber would keep the buffered frames (and the server) forever
+            if subscriber.transport.get_write_buffer_size():
+                subscriber.transport.abort()
+            else:
+                subscriber.transport.close()
+        await self._server.wait_closed()
+        self._server = None
+        _remove_stale_socket(self.path)
+        logger.info(f"Band publisher stopped: {self.sequence} frames published, {self.frames_dropped} dropped.")
+
+    def publish(
+            self, bands: np.ndarray, timestamp: int | None = None, beat: bool = False,
+            balance: tuple[float, float] | None = None):
+        """ one frame to every subscriber, `timestamp` -> perf_counter_ns of the audio window """
+        self.sequence += 1
+        if not self.subscribers:
+            return
+
+        flags = (FLAG_BEAT if beat else 0) | (FLAG_STEREO if balance is not None else 0)
+        left, right = balance if balance is not None else (1.0, 1.0)
+        header = FRAME_HEADER.pack(
+            self.sequence, timestamp if timestamp is not None else time.perf_counter_ns(),
+            flags, len(bands), left, right)
+        frame = header + bands.astype(BAND_DTYPE, copy=False).tobytes()
+
+        dropped = 0
+        for subscriber in self.subscribers:
+            if not subscriber.send(frame, self.max_pending):
+                dropped += 1
+        if dropped:
+            self.frames_dropped += dropped
+            METRICS.count("frames_dropped_subscribers", dropped)
+            HOT_LOGGER.warning("subscriber drops", "A band subscriber is too slow, {} frames dropped.", dropped)
+
+
+class BandFrame:
+    """ one received frame """
+
+    __slots__ = ("sequence", "timestamp", "beat", "balance", "bands")
+
+    def __init__(
+            self, sequence: int, timestamp: int, beat: bool, balance: tuple[float, float] | None, bands: np.ndarray):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.beat = beat
+        # left/right shares of the stereo analysis, None -> mono
+        self.balance = balance
+        self.bands = bands
+
+
+class BandSubscriber:
+    """
+    Blocking client of the BandPublisher socket for the other tools:
+
+        with BandSubscriber("/tmp/launchpad_visualizer.sock") as subscriber:
+            for frame in subscriber:
+                ...
+
+    `dropped` counts the frames the publisher skipped for this subscriber (sequence gaps).
+    """
+
+    def __init__(self, path: str, timeout: float | None = None):
+        self.path = path
+        self.timeout = timeout
+        self.dropped = 0
+        self._last_sequence = None
+        self._sock = None
+        self._file = None
+
+    def connect(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.path)
+        self._file = self._sock.makefile("rb")
+        magic, version = HELLO.unpack(self._read(HELLO.size))
+        if magic != MAGIC or version != PROTOCOL_VERSION:
+            self.close()
+            raise ValueError(f"{self.path}: not a band publisher (protocol {magic!r} v{version})")
+
+    def close(self):
+        for resource in (self._file, self._sock):
+            if resource is not None:
+                resource.close()
+        self._file = None
+        self._sock = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return
+            yield frame
+
+    def receive(self) -> BandFrame | None:
+        """ the next frame (blocks), None -> the publisher has stopped """
+        try:
+            header = self._read(FRAME_HEADER.size)
+        except EOFError:
+            return None
+        sequence, timestamp, flags, bands_count, left, right = FRAME_HEADER.unpack(header)
+        bands = np.frombuffer(self._read(bands_count * BAND_DTYPE.itemsize), dtype=BAND_DTYPE)
+
+        if self._last_sequence is not None:
+            self.dropped += sequence - self._last_sequence - 1
+        self._last_sequence = sequence
+        balance = (left, right) if flags & FLAG_STEREO else None
+        return BandFrame(sequence, timestamp, bool(flags & FLAG_BEAT), balance, bands)
+
+    def _read(self, size: int) -> bytes:
+        data = self._file.read(size)
+        if len(data) < size:
+            raise EOFError(f"{self.path}: the publisher closed the connection")
+        return data
+
+
+def _remove_stale_socket(path: str):
+    # a socket file left by a previous run would make the bind fail, anything else is not touched
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
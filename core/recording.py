@@ -0,0 +1,193 @@
+import json
+import os
+import time
+import numpy as np
+from core.devices import LaunchpadDevice, set_render_rate
+from core.laucnhpad_visualization import visualize_audio_bands
+from utils.logger import logger
+
+FORMAT_VERSION = 1
+
+META_FILE = "meta.json"
+FRAMES_FILE = "frames.bin"
+LEDS_FILE = "leds.bin"
+
+# frame flags
+FLAG_BEAT = 1
+# the devices were reset right before this frame (idle mode)
+FLAG_RESET = 2
+
+# one record per changed LED of a rendered frame
+LED_DTYPE = np.dtype([("frame", "<u4"), ("device", "u1"), ("led", "u1"), ("rgb", "u1", (3,))])
+
+
+def frame_dtype(bands_count: int, stereo: bool = False) -> np.dtype:
+    """
+    one record per rendered frame: seconds since the recording start, refresh rate, flags, bands
+    (+ the left/right balance of the stereo analysis)
+    """
+    fields = [("time", "<f8"), ("fps", "<f8"), ("flags", "u1"), ("bands", "<f8", (bands_count,))]
+    if stereo:
+        fields.append(("balance", "<f8", (2,)))
+    return np.dtype(fields)
+
+
+class Recorder:
+    """
+    Writes the rendered band frames and the LED diff stream of every device into a recording directory:
+    two flat binary files of fixed-size records (read back as memory-mapped numpy arrays) and the metadata.
+    """
+
+    def __init__(
+            self, path: str, bands_count: int, samplerate: int, devices_count: int = 1, stereo: bool = False, **meta):
+        self.path = path
+        self.bands_count = bands_count
+        self.stereo = stereo
+        self.meta = {
+            "version": FORMAT_VERSION,
+            "bands_count": bands_count,
+            "samplerate": samplerate,
+            "devices_count": devices_count,
+            "stereo": stereo,
+            **meta,
+        }
+        self.frames = 0
+        self.leds = 0
+        self._frame = np.zeros(1, dtype=frame_dtype(bands_count, stereo))
+        self._reset_pending = False
+        self._started = 0.0
+        self._frames_file = None
+        self._leds_file = None
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, META_FILE), "w") as file:
+            json.dump(self.meta, file, indent=2)
+        self._frames_file = open(os.path.join(self.path, FRAMES_FILE), "wb")
+        self._leds_file = open(os.path.join(self.path, LEDS_FILE), "wb")
+        self._started = time.monotonic()
+        logger.info(f"Recording to {self.path}.")
+
+    def close(self):
+        for file in (self._frames_file, self._leds_file):
+            if file is not None:
+                file.close()
+        self._frames_file = None
+        self._leds_file = None
+        logger.info(f"Recording closed: {self.frames} frames, {self.leds} LED changes.")
+
+    def record_frame(
+            self, bands: np.ndarray, beat: bool = False, fps: float = 0.0, balance: tuple[float, float] | None = None):
+        """ the frame about to be rendered, the LED diffs recorded after it belong to it """
+        frame = self._frame[0]
+        if self.stereo:
+            frame["balance"] = balance if balance is not None else (1.0, 1.0)
+        frame["time"] = time.monotonic() - self._started
+        frame["fps"] = fps
+        frame["flags"] = (FLAG_BEAT if beat else 0) | (FLAG_RESET if self._reset_pending else 0)
+        frame["bands"] = bands
+        self._frames_file.write(self._frame.tobytes())
+        self._reset_pending = False
+        self.frames += 1
+
+    def record_leds(self, device: int, leds: dict):
+        if not leds or not self.frames:
+            return
+        records = np.empty(len(leds), dtype=LED_DTYPE)
+        records["frame"] = self.frames - 1
+        records["device"] = device
+        records["led"] = list(leds.keys())
+        records["rgb"] = list(leds.values())
+        self._leds_file.write(records.tobytes())
+        self.leds += len(records)
+
+    def record_reset(self):
+        self._reset_pending = True
+
+
+class RecordedOutput:
+    """ device output wrapper: writes the LED diffs into the recorder, then passes them to the real output """
+
+    def __init__(self, output, recorder: Recorder, device: int):
+        self.output = output
+        self.recorder = recorder
+        self.device = device
+
+    def submit(self, leds: dict, timestamp: int | None = None):
+        self.recorder.record_leds(self.device, leds)
+        self.output.submit(leds, timestamp)
+
+    def reset(self):
+        self.recorder.record_reset()
+        self.output.reset()
+
+    def __getattr__(self, name):
+        # lp, start/stop, stats, flush time of the wrapped output
+        return getattr(self.output, name)
+
+
+class Recording:
+    """ a recording directory opened for reading, `frames` and `leds` are memory-mapped record arrays """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta = json.load(file)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {self.meta.get('version')}")
+
+        self.bands_count = self.meta["bands_count"]
+        self.samplerate = self.meta["samplerate"]
+        self.stereo = self.meta.get("stereo", False)
+        self.frames = _memmap(os.path.join(path, FRAMES_FILE), frame_dtype(self.bands_count, self.stereo))
+        self.leds = _memmap(os.path.join(path, LEDS_FILE), LED_DTYPE)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self) -> float:
+        return float(self.frames["time"][-1]) if len(self.frames) else 0.0
+
+    def frame_leds(self, frame: int, device: int = 0) -> dict:
+        """ the recorded LED diff (led -> color) of the device for the frame """
+        start, end = np.searchsorted(self.leds["frame"], (frame, frame + 1))
+        records = self.leds[start:end]
+        records = records[records["device"] == device]
+        return {int(led): tuple(int(c) for c in rgb) for led, rgb in zip(records["led"], records["rgb"])}
+
+
+def _memmap(path: str, dtype: np.dtype) -> np.ndarray:
+    # an empty file can't be mapped
+    if os.path.getsize(path) < dtype.itemsize:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(os.path.getsize(path) // dtype.itemsize,))
+
+
+def replay(recording: Recording, devices: list[LaunchpadDevice], realtime: bool = True, on_frame=None) -> int:
+    """
+    feeds the recorded frames into `visualize_audio_bands` (at the recorded pace or as fast as possible),
+    `on_frame(index, render_ns)` is called after every rendered frame. Returns the number of frames.
+    """
+    fps = None
+    started = time.monotonic()
+    for index, frame in enumerate(recording.frames):
+        if realtime:
+            delay = started + float(frame["time"]) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if frame["flags"] & FLAG_RESET:
+            for device in devices:
+                device.reset()
+        # the side buttons smoothing depends on the refresh rate of the recording
+        if frame["fps"] and frame["fps"] != fps:
+            fps = frame["fps"]
+            set_render_rate(devices, recording.samplerate / float(fps))
+
+        balance = tuple(frame["balance"].tolist()) if recording.stereo else None
+        render_start = time.perf_counter_ns()
+        visualize_audio_bands(devices, frame["bands"], render_start, bool(frame["flags"] & FLAG_BEAT), balance)
+        if on_frame is not None:
+            on_frame(index, time.perf_counter_ns() - render_start)
+    return len(recording.frames)
@@ -0,0 +1,74 @@
+import numpy as np
+from core.config import CONFIG
+
+
+class AudioRingBuffer:
+    """
+    Preallocated float32 buffer for the captured audio.
+
+    The reader writes straight into it (`readinto` into `writable()` + `commit()`),
+    analysis windows are returned as numpy views over the same memory, nothing is copied per window.
+    A new window of `window_frames` is ready every `hop_frames` new frames (hop == window -> no overlap).
+    A returned view is valid until the next `writable()` call.
+    """
+
+    def __init__(self, window_frames: int, channels: int, hop_frames: int | None = None, capacity_windows: int = 8):
+        hop_frames = hop_frames or window_frames
+        if not 0 < hop_frames <= window_frames:
+            raise ValueError(f"Hop size must be in range (0, {window_frames}], got {hop_frames}")
+
+        self.window_frames = window_frames
+        self.hop_frames = hop_frames
+        self.channels = channels
+        self.frame_bytes = CONFIG.audio.SAMPLE_WIDTH * channels
+        self.window_bytes = window_frames * self.frame_bytes
+        self.hop_bytes = hop_frames * self.frame_bytes
+        self.window_samples = window_frames * channels
+
+        self._raw = bytearray(self.window_bytes * capacity_windows)
+        self._mem = memoryview(self._raw)
+        self._samples = np.frombuffer(self._raw, dtype=np.float32)
+
+        # positions in bytes, read position is the end of the last returned window
+        self._read_pos = self.window_bytes - self.hop_bytes
+        self._write_pos = 0
+
+    @property
+    def available(self) -> int:
+        """ unread bytes """
+        return self._write_pos - self._read_pos
+
+    def writable(self) -> memoryview:
+        """
+        Free space at the end of the buffer.
+        When it gets smaller than one window, the history of the next window and the unread tail
+        are moved to the start (rarely, it is less than a window + hop).
+        """
+        if len(self._raw) - self._write_pos < self.window_bytes:
+            self._compact()
+        return self._mem[self._write_pos:]
+
+    def commit(self, nbytes: int):
+        """ marks `nbytes` written into the `writable()` view """
+        self._write_pos += nbytes
+
+    def read_window(self) -> np.ndarray | None:
+        """ returns the next window as a view or None if less than a hop of new data is buffered """
+        if self.available < self.hop_bytes:
+            return None
+
+        self._read_pos += self.hop_bytes
+        end = self._read_pos // CONFIG.audio.SAMPLE_WIDTH
+        return self._samples[end - self.window_samples:end]
+
+    def clear(self):
+        self._read_pos = self.window_bytes - self.hop_bytes
+        self._write_pos = 0
+
+    def _compact(self):
+        # the next window starts (window - hop) before the current read position
+        keep_from = self._read_pos - (self.window_bytes - self.hop_bytes)
+        kept = self._write_pos - keep_from
+        self._mem[:kept] = self._mem[keep_from:self._write_pos]
+        self._read_pos -= keep_from
+        self._write_pos = kept
@@ -0,0 +1,149 @@
+import asyncio
+import time
+import numpy as np
+from core.devices import LaunchpadDevice, set_render_rate
+from core.laucnhpad_visualization import visualize_audio_bands
+from utils.logger import HOT_LOGGER
+from utils.metrics import METRICS
+
+# the refresh rate is changed at most once per ADAPT_INTERVAL seconds
+ADAPT_INTERVAL = 0.5
+FPS_DOWN_STEP = 0.8
+FPS_UP_STEP = 1.1
+# the rate goes back up only when the flush takes less than this part of the budget
+FPS_UP_MARGIN = 0.5
+
+
+class FrameScheduler:
+    """
+    Decouples the LED refresh rate from the analysis rate: the analysis publishes its bands every hop,
+    the render loop shows the latest ones at `fps`.
+
+    When the MIDI flush of a frame (the slowest device) takes longer than `flush_budget` of the frame time,
+    the rate is lowered step by step down to `min_fps`, and raised back to `target_fps` when the link keeps up.
+    """
+
+    def __init__(
+            self, devices: list[LaunchpadDevice], samplerate: int, target_fps: float = 60.0,
+            min_fps: float = 15.0, flush_budget: float = 0.8):
+        self.devices = devices
+        self.samplerate = samplerate
+        self.target_fps = target_fps
+        self.min_fps = min(min_fps, target_fps)
+        self.flush_budget = flush_budget
+        self.fps = 0.0
+
+        self._bands = None
+        self._timestamp = None
+        self._beat = False
+        self._balance = None
+        self._fresh = False
+        # cleared while paused (idle mode), the render loop sleeps without waking up
+        self._active = asyncio.Event()
+        self._active.set()
+        self._last_adapt = 0.0
+        self.frames_rendered = 0
+        # optional core.recording.Recorder, gets every rendered frame
+        self.recorder = None
+        # optional core.publisher.BandPublisher, gets every analyzed frame
+        self.publisher = None
+
+        self.set_fps(target_fps)
+
+    def publish(
+            self, bands: np.ndarray, timestamp: int | None = None, beat: bool = False,
+            balance: tuple[float, float] | None = None):
+        """
+        stores a copy of the bands (the analysis reuses its arrays), the next frame shows them.
+        A beat is kept until the next frame even if newer bands without it come first.
+        `balance` -> left/right shares of the stereo analysis for the side columns.
+        """
+        if self._bands is None or self._bands.shape != bands.shape:
+            self._bands = np.empty_like(bands)
+        np.copyto(self._bands, bands)
+        self._timestamp = timestamp
+        self._beat = self._beat or beat
+        self._balance = balance
+        self._fresh = True
+        if self.publisher is not None:
+            self.publisher.publish(self._bands, timestamp, beat, balance)
+
+    def clear(self):
+        """ drops the not yet rendered bands (the devices are about to be reset) """
+        self._fresh = False
+        self._beat = False
+
+    def pause(self):
+        """ stops rendering (idle mode), the pending bands are dropped """
+        self._active.clear()
+        self.clear()
+
+    def resume(self):
+        self._active.set()
+
+    def configure(self, target_fps: float, min_fps: float, flush_budget: float):
+        """ new rate limits (config reload), the rate starts over from the target """
+        self.target_fps = target_fps
+        self.min_fps = min(min_fps, target_fps)
+        self.flush_budget = flush_budget
+        self.set_fps(target_fps)
+
+    def set_fps(self, fps: float):
+        self.fps = fps
+        # the side buttons smoothing and the beat flash fade follow the render rate
+        set_render_rate(self.devices, self.samplerate / fps)
+
+    def render(self) -> bool:
+        """ renders the latest bands if there are new ones since the last frame """
+        if not self._fresh:
+            return False
+        self._fresh = False
+        beat, self._beat = self._beat, False
+
+        if self.recorder is not None:
+            self.recorder.record_frame(self._bands, beat, self.fps, self._balance)
+
+        render_start = time.perf_counter_ns()
+        visualize_audio_bands(self.devices, self._bands, self._timestamp, beat, self._balance)
+        METRICS.record("render", time.perf_counter_ns() - render_start)
+        self.frames_rendered += 1
+        return True
+
+    def adapt(self):
+        now = time.monotonic()
+        if now - self._last_adapt < ADAPT_INTERVAL:
+            return
+
+        flush = max(device.output.flush_ns for device in self.devices) / 1e9
+        budget = self.flush_budget / self.fps
+
+        if flush > budget and self.fps > self.min_fps:
+            fps = max(self.min_fps, self.fps * FPS_DOWN_STEP)
+        elif flush < budget * FPS_UP_MARGIN and self.fps < self.target_fps:
+            fps = min(self.target_fps, self.fps * FPS_UP_STEP)
+        else:
+            return
+
+        HOT_LOGGER.info(
+            "refresh rate", "MIDI flush {:.2f} ms, refresh rate {:.1f} -> {:.1f} FPS.", flush * 1e3, self.fps, fps)
+        self.set_fps(fps)
+        self._last_adapt = now
+
+    async def run(self):
+        """ render loop, runs until cancelled """
+        next_frame = time.perf_counter()
+        while True:
+            if not self._active.is_set():
+                await self._active.wait()
+                next_frame = time.perf_counter()
+
+            next_frame += 1.0 / self.fps
+            delay = next_frame - time.perf_counter()
+            if delay < 0:
+                # late, skip the missed frames instead of bursting them
+                next_frame = time.perf_counter()
+                delay = 0.0
+            await asyncio.sleep(delay)
+
+            if self.render():
+                self.adapt()
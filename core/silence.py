@@ -0,0 +1,67 @@
+import time
+import numpy as np
+from utils.logger import HOT_LOGGER
+
+GATE_ACTIVE = "active"    # signal, every window is analyzed
+GATE_PENDING = "pending"  # silence shorter than the idle delay, nothing is analyzed
+GATE_IDLE = "idle"        # long silence: state resetted, no analysis, no rendering, no MIDI
+
+
+class SilenceGate:
+    """
+    Time-domain RMS/peak gate in front of the FFT.
+
+    A window is silent when both its RMS and its peak are below the thresholds (float noise
+    of an idle sound card is not a signal). Silent windows are not analyzed, after `idle_after`
+    seconds (monotonic) of silence the gate goes idle until the signal is back.
+    """
+
+    def __init__(self, rms_threshold: float, peak_threshold: float, idle_after: float):
+        self.rms_threshold = rms_threshold
+        self.peak_threshold = peak_threshold
+        self.idle_after = idle_after
+
+        self.state = GATE_ACTIVE
+        # the state changed on the last `process` call
+        self.changed = False
+        self._silence_start = None
+
+    @property
+    def idle(self) -> bool:
+        return self.state == GATE_IDLE
+
+    def is_silent(self, window: np.ndarray) -> bool:
+        # peak first: it rejects most of the signal windows without the dot product
+        peak = max(float(window.max()), -float(window.min()))
+        if peak >= self.peak_threshold:
+            return False
+        mean_square = float(np.dot(window, window)) / len(window)
+        return mean_square < self.rms_threshold * self.rms_threshold
+
+    def process(self, window: np.ndarray) -> bool:
+        """ True -> the window has a signal and should be analyzed """
+        previous = self.state
+
+        if not self.is_silent(window):
+            if previous == GATE_IDLE:
+                HOT_LOGGER.info("signal back", "Signal is back, leaving idle mode.")
+            self.state = GATE_ACTIVE
+            self._silence_start = None
+        else:
+            now = time.monotonic()
+            if previous == GATE_ACTIVE:
+                self.state = GATE_PENDING
+                self._silence_start = now
+                HOT_LOGGER.info(
+                    "signal lost", "Signal lost. Starting {} second countdown to idle mode.", self.idle_after)
+            elif previous == GATE_PENDING and now - self._silence_start >= self.idle_after:
+                self.state = GATE_IDLE
+                HOT_LOGGER.info("idle", "{} second pause detected. Entering idle mode.", self.idle_after)
+
+        self.changed = self.state != previous
+        return self.state == GATE_ACTIVE
+
+    def reset(self):
+        self.state = GATE_ACTIVE
+        self.changed = False
+        self._silence_start = None
@@ -0,0 +1,160 @@
+import numpy as np
+from core.fft import FFT_NUMPY, REAL_DTYPE, get_plan
+from core.filterbank import SCALE_CUSTOM, filter_matrix
+
+# rows of StereoAnalyzer.channel_bands
+CHANNEL_LEFT = 0
+CHANNEL_RIGHT = 1
+CHANNEL_MID = 2
+CHANNEL_SIDE = 3
+# the bands shown by the side columns (left: sub bass, right: bass), their stereo balance pans the columns
+SIDE_BANDS = slice(0, 2)
+
+
+class SpectralAnalyzer:
+    """
+    FFT band analyzer with everything precomputed for one samplerate/chunk size.
+
+    Window, frequency bins, the filterbank matrix (bands x bins) and the FFT plan (core.fft backend) are built once,
+    all the band RMS values are computed with one matrix multiply into preallocated float32 buffers.
+    """
+
+    def __init__(
+            self, samplerate: int, chunk_size: int, bands_range, channels: int = 2,
+            triangular: bool = False, scale: str = SCALE_CUSTOM, backend: str = FFT_NUMPY, workers: int = 1):
+        self.samplerate = samplerate
+        self.chunk_size = chunk_size
+        self.channels = channels
+        self.bands_range = tuple((low, high) for low, high in bands_range)
+        self.backend = backend
+        self._plan = get_plan(backend, self._fft_shape(), workers)
+
+        # downmix is a sum of the channels, the mean is folded into the window
+        self.window = (np.hanning(chunk_size) / channels).astype(REAL_DTYPE)
+        self.freqs = np.fft.rfftfreq(chunk_size, 1.0 / samplerate)
+
+        # band i = mean power of its bins (rectangular: freqs >= low & freqs < high)
+        self.filters = filter_matrix(self.freqs, self.bands_range, triangular, scale)
+        # only the bins some band uses take part in the multiply
+        used = np.flatnonzero(self.filters.any(axis=0))
+        self._first_bin, self._last_bin = (int(used[0]), int(used[-1]) + 1) if len(used) else (0, 0)
+        self._filters = np.ascontiguousarray(self.filters[:, self._first_bin:self._last_bin], dtype=REAL_DTYPE)
+
+        # preallocated buffers, the downmix is written straight into the FFT input
+        bins = len(self.freqs)
+        self._power = np.empty(bins, dtype=REAL_DTYPE)
+        self._bands = np.empty(len(self.bands_range), dtype=REAL_DTYPE)
+
+    def _fft_shape(self) -> tuple[int, ...]:
+        return (self.chunk_size,)
+
+    @property
+    def bands_count(self) -> int:
+        return len(self._bands)
+
+    @property
+    def power(self) -> np.ndarray:
+        """ power spectrum of the last processed chunk (reused buffer), for the stages after the bands """
+        return self._power
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        Returns the RMS values for each frequency band.
+        The returned array is reused by the next call, copy it if you need to keep it.
+        """
+        mono = self._plan.input
+        chunk.reshape(-1, self.channels).sum(axis=1, out=mono)
+        mono *= self.window
+
+        spectrum = self._plan.execute()
+
+        power = self._power
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+
+        bands = self._bands
+        np.dot(self._filters, power[self._first_bin:self._last_bin], out=bands)
+        np.sqrt(bands, out=bands)
+        return bands
+
+
+class StereoAnalyzer(SpectralAnalyzer):
+    """
+    Per channel bands: both channels go through one batched 2-D rfft plan, the channels are a strided view
+    of the interleaved chunk (no copy before the window). The mid/side spectra are (L ± R) / 2 of the
+    channel spectra (the FFT is linear), so there is no third FFT.
+
+    `process` returns the mid bands (the same as the mono downmix), `channel_bands` has all four
+    (CHANNEL_* rows), `power` is the mid power spectrum.
+    """
+
+    def __init__(
+            self, samplerate: int, chunk_size: int, bands_range, channels: int = 2,
+            triangular: bool = False, scale: str = SCALE_CUSTOM, backend: str = FFT_NUMPY, workers: int = 1):
+        if channels != 2:
+            raise ValueError(f"Stereo analysis needs 2 channels, got {channels}")
+        super().__init__(samplerate, chunk_size, bands_range, channels, triangular, scale, backend, workers)
+
+        # per channel window, the mid is averaged from the spectra
+        self.window = np.hanning(chunk_size).astype(REAL_DTYPE)
+        self._filters_t = np.ascontiguousarray(self._filters.T)
+
+        bins = len(self.freqs)
+        self._spectra = np.empty((4, bins), dtype=self._plan.output.dtype)
+        self._powers = np.empty((4, bins), dtype=REAL_DTYPE)
+        self._channel_bands = np.empty((4, len(self.bands_range)), dtype=REAL_DTYPE)
+        self._power = self._powers[CHANNEL_MID]
+
+    def _fft_shape(self) -> tuple[int, ...]:
+        return 2, self.chunk_size
+
+    @property
+    def channel_bands(self) -> np.ndarray:
+        """ (4, bands) band RMS values of the last chunk: left, right, mid, side (reused buffer) """
+        return self._channel_bands
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        np.multiply(chunk.reshape(-1, 2).T, self.window, out=self._plan.input)
+
+        spectra = self._spectra
+        np.copyto(spectra[:2], self._plan.execute())
+        np.add(spectra[CHANNEL_LEFT], spectra[CHANNEL_RIGHT], out=spectra[CHANNEL_MID])
+        np.subtract(spectra[CHANNEL_LEFT], spectra[CHANNEL_RIGHT], out=spectra[CHANNEL_SIDE])
+        spectra[2:] *= 0.5
+
+        powers = self._powers
+        np.abs(spectra, out=powers)
+        np.square(powers, out=powers)
+
+        bands = self._channel_bands
+        np.dot(powers[:, self._first_bin:self._last_bin], self._filters_t, out=bands)
+        np.sqrt(bands, out=bands)
+        return bands[CHANNEL_MID]
+
+    def balance(self) -> tuple[float, float]:
+        """ left and right share of the SIDE_BANDS energy, 1.0 for the louder channel (1.0, 1.0 for silence) """
+        left = float(self._channel_bands[CHANNEL_LEFT, SIDE_BANDS].sum())
+        right = float(self._channel_bands[CHANNEL_RIGHT, SIDE_BANDS].sum())
+        loudest = max(left, right)
+        if loudest <= 0.0:
+            return 1.0, 1.0
+        return left / loudest, right / loudest
+
+
+_ANALYZERS: dict[tuple, SpectralAnalyzer] = {}
+
+
+def get_analyzer(
+        samplerate: int, chunk_size: int, bands_range, channels: int = 2,
+        triangular: bool = False, scale: str = SCALE_CUSTOM, stereo: bool = False,
+        backend: str = FFT_NUMPY, workers: int = 1) -> SpectralAnalyzer:
+    """ returns the cached analyzer for these parameters (creates it on the first call) """
+    key = (
+        samplerate, chunk_size, channels, tuple((low, high) for low, high in bands_range), triangular, scale, stereo,
+        backend, workers)
+    analyzer = _ANALYZERS.get(key)
+    if analyzer is None:
+        cls = StereoAnalyzer if stereo else SpectralAnalyzer
+        analyzer = cls(samplerate, chunk_size, bands_range, channels, triangular, scale, backend, workers)
+        _ANALYZERS[key] = analyzer
+    return analyzer
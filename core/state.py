@@ -1,63 +1,84 @@
 # Global variables which will be using at the runtime moment
-from datetime import datetime, timedelta
+import math
+import numpy as np
 from core.config import CONFIG
-from utils.logger import logger
+from core.constants import PSYCHOACOUSTIC_WEIGHTS
+from core.filterbank import SCALE_CUSTOM, equal_loudness_weights
+from core.normalizer import BandNormalizer
+from utils.general import hop_alpha
+from utils.logger import HOT_LOGGER
 
-BANDS_POS = []
+# Smoothing coefficients (tuned per REFERENCE_HOP frames, rescaled to the hop size)
+ALPHA_0_100 = hop_alpha(0.8, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
+ALPHA_100_200 = hop_alpha(0.8, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
+ALPHA_6400_22000 = hop_alpha(0.3, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
+ALPHA_800_1600 = hop_alpha(0.3, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
 
-# Smoothing coefficients
-ALPHA_0_100 = 0.8
-ALPHA_100_200 = 0.8
-ALPHA_6400_22000 = 0.3
-ALPHA_800_1600 = 0.4
-ALPHA_800_1600 = 0.3
+# indexes of the side buttons levels in VisualizerState.smoothed
+SMOOTHED_0_100 = 0
+SMOOTHED_100_200 = 1
+SMOOTHED_800_1600 = 2
+SMOOTHED_3200_6400 = 3
+SMOOTHED_6400_22000 = 4
+SMOOTHED_ALPHAS = np.array([ALPHA_0_100, ALPHA_100_200, ALPHA_800_1600, ALPHA_800_1600, ALPHA_6400_22000])
+SMOOTHED_BASE_ALPHAS = np.array([0.8, 0.8, 0.3, 0.3, 0.3])
 
-# state of side buttons
-class VisualizerState:
-    def __init__(self):
-        self.smoothed_0_100 = 0.0
-        self.smoothed_100_200 = 0.0
-        self.smoothed_6400_22000 = 0.0
-        self.smoothed_3200_6400 = 0.0
-        self.smoothed_800_1600 = 0.0
 
+def smoothed_alphas(update_frames: float) -> np.ndarray:
+    """ side buttons smoothing for one update per `update_frames` frames (the render rate, not the hop) """
+    return hop_alpha(SMOOTHED_BASE_ALPHAS, update_frames, CONFIG.ema.REFERENCE_HOP)
 
-VSTATE = VisualizerState()
 
-VISUAL_SIDE_STATE_CACHE = [(0, 0, 0) for _ in range(32)]
-VSSCACHE_LEFT_INDEX = 0
-VSSCACHE_RIGHT_INDEX = 8
-VSSCACHE_TOP_INDEX = 16
-VSSCACHE_BOTTOM_INDEX = 24
+def beat_decay(update_frames: float) -> float:
+    """ beat flash level multiplier for one update per `update_frames` frames """
+    return math.exp(-update_frames / (CONFIG.audio.SAMPLERATE * CONFIG.beat.FLASH_DECAY))
 
-STATE_RESETTED = True
-GLOBAL_PAUSE_START_TIME = None
-STATE_RESETTED_DATETIME = None
 
-def reset_state():
-    global BANDS_POS, VISUAL_SIDE_STATE_CACHE, STATE_RESETTED, STATE_RESETTED_DATETIME, VSTATE, GLOBAL_PAUSE_START_TIME
+BEAT_DECAY = beat_decay(CONFIG.audio.HOP_SIZE)
 
-    if STATE_RESETTED:
-        logger.debug("State is already resetted.")
-        return False
 
-    if STATE_RESETTED_DATETIME > datetime.now():
-        logger.debug("State not resetted because it was resetted less than %s seconds ago", CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE.total_seconds())
-        return False
+# state of side buttons
+class VisualizerState:
+    def __init__(self, alphas: np.ndarray = SMOOTHED_ALPHAS):
+        # smoothed levels of the side buttons bands (SMOOTHED_* indexes)
+        self.smoothed = np.zeros(len(SMOOTHED_ALPHAS))
+        # EMA coefficients, they depend on how often the device is rendered
+        self.alphas = alphas
+        # beat flash of the pads, 1.0 on a beat and fading out by `beat_decay` every render
+        self.beat_level = 0.0
+        self.beat_decay = BEAT_DECAY
+
+    def reset(self):
+        self.smoothed.fill(0.0)
+        self.beat_level = 0.0
 
-    logger.info("Resetting state...")
-    BANDS_POS = []
-    VSTATE = VisualizerState()
-    VISUAL_SIDE_STATE_CACHE = [(0, 0, 0) for _ in VISUAL_SIDE_STATE_CACHE]
 
-    STATE_RESETTED = True
-    STATE_RESETTED_DATETIME = datetime.now()
-    GLOBAL_PAUSE_START_TIME = None
+def band_weights() -> np.ndarray:
+    """ per band weights: the tuned ones for the default octave bands, the equal-loudness curve for the generated bands """
+    if CONFIG.bands.SCALE == SCALE_CUSTOM and len(CONFIG.bands.RANGE) == len(PSYCHOACOUSTIC_WEIGHTS):
+        return np.array(PSYCHOACOUSTIC_WEIGHTS)
+    return equal_loudness_weights(CONFIG.bands.RANGE, CONFIG.bands.SCALE)
 
-    # TODO: change from config to constants
-    logger.debug("Resetting state...")
-    CONFIG.bands.FAST = [0.0] * len(CONFIG.bands.FAST)
-    CONFIG.bands.SLOW = [0.0] * len(CONFIG.bands.SLOW)
 
-    logger.info("State resetted.")
-    return True
\ No newline at end of file
+BAND_WEIGHTS = band_weights()
+
+# fast/slow EMA state of the bands normalization
+NORMALIZER = BandNormalizer(
+    BAND_WEIGHTS,
+    hop_alpha(CONFIG.ema.FAST_SMOOTHING, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP),
+    hop_alpha(CONFIG.ema.SLOW_SMOOTHING, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP),
+    CONFIG.threshold.NOISE_GATE,
+)
+
+
+def configure_normalizer(normalizer: BandNormalizer = NORMALIZER):
+    """ weights, EMA coefficients and the noise gate from the current config (config reload), keeps the EMA state """
+    normalizer.weights[:] = band_weights()
+    normalizer.fast_alpha = hop_alpha(CONFIG.ema.FAST_SMOOTHING, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
+    normalizer.slow_alpha = hop_alpha(CONFIG.ema.SLOW_SMOOTHING, CONFIG.audio.HOP_SIZE, CONFIG.ema.REFERENCE_HOP)
+    normalizer.noise_gate = CONFIG.threshold.NOISE_GATE
+
+def reset_state():
+    """ fresh normalization state, done once per pause (when the silence gate goes idle) """
+    NORMALIZER.reset()
+    HOT_LOGGER.info("state reset", "State resetted.")
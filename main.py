@@ -2,128 +2,192 @@ import cProfile
 import pstats
 import asyncio
 import argparse
-from datetime import datetime
+import time
 import numpy as np
-import launchpad_py as launchpad
-from asyncstdlib import enumerate as aenumerate
-from core.config import CONFIG
-from core.laucnhpad_visualization import visualize_audio_bands
-from utils.general import find_opened_port
-from utils.logger import logger
-from core.capture_audio import capture_audio, handle_chunk
-from core.state import reset_state, STATE_RESETTED, GLOBAL_PAUSE_START_TIME
-from core.constants import PSYCHOACOUSTIC_WEIGHTS
-
-def process_audio_chunk(
-    chunk, samplerate, channels, chunk_size, window,
-    bands_range,
-):
+from core.config import CONFIG, config_file_path
+from core.config_watcher import ConfigWatcher
+from utils.general import open_launchpads
+from utils.logger import logger, HOT_LOGGER, setup_session_logging
+from utils.metrics import METRICS, log_metrics_periodically, serve_metrics
+from core.capture_audio import capture_audio, create_backend, CaptureBackend, BACKENDS
+from core.state import reset_state, NORMALIZER
+from core.spectrum import SpectralAnalyzer
+from core.midi_output import MidiOutputWorker
+from core.midi_ports import PortCache, PortMonitor, open_rtmidi_writers
+from core.devices import LaunchpadDevice, assign_layout, LAYOUTS
+from core.scheduler import FrameScheduler
+from core.analysis_worker import AnalysisProcess, AnalysisStages, choose_analysis_fft
+from core.fft import FFT_NUMPY
+from core.laucnhpad_visualization import rebuild_layout
+from core.onset import OnsetDetector
+from core.silence import SilenceGate
+from core.recording import Recorder, RecordedOutput, Recording, replay
+from core.publisher import BandPublisher
+
+def process_audio_chunk(chunk, analyzer: SpectralAnalyzer):
     """
     Processes a single audio chunk and returns the RMS values for each frequency band.
     """
-    if channels == 2:
-        chunk = chunk.reshape(-1, 2)
-        chunk_mono = chunk.mean(axis=1)
-    else:
-        chunk_mono = chunk
-
-    # Apply window function and perform FFT
-    chunk_windowed = chunk_mono * window
-    spectrum = np.abs(np.fft.rfft(chunk_windowed))
-    freqs = np.fft.rfftfreq(len(chunk_windowed), 1.0 / samplerate)
-
-    # Calculate RMS for each frequency band
-    bands_rms = []
-    for low, high in bands_range:
-        mask = (freqs >= low) & (freqs < high)
-        band_vals = spectrum[mask]
-        if band_vals.size > 0:
-            band_rms = np.sqrt(np.mean(band_vals ** 2))
-            bands_rms.append(band_rms)
-        else:
-            bands_rms.append(0.0)
+    return analyzer.process(chunk)
 
-    return bands_rms
+def detect_beat(onsets: OnsetDetector | None) -> bool:
+    """
+    Onset/beat detection on the spectrum of the last processed chunk (no second FFT).
+    """
+    return onsets.process() if onsets is not None else False
 
 def normalize_bands(bands_rms: np.ndarray):
     """
-    Bands normalazing
+    Bands normalazing (see BandNormalizer), the returned array is reused by the next call
     """
-    global CONFIG, PSYCHOACOUSTIC_WEIGHTS
+    return NORMALIZER.process(bands_rms)
+
+async def play_and_visualize(
+        devices: list[LaunchpadDevice], chunk_size: int = 1024, hop_size: int | None = None,
+        backend: CaptureBackend | None = None, analysis_process: bool = False, recorder: Recorder | None = None,
+        publish_path: str | None = None, fft_backend: str = FFT_NUMPY):
+    global CONFIG
 
-    fast_ema = CONFIG.ema.FAST_SMOOTHING
-    slow_ema = CONFIG.ema.SLOW_SMOOTHING
+    # the analysis runs every hop, the devices are rendered at the scheduler refresh rate
+    scheduler = FrameScheduler(
+        devices, CONFIG.audio.SAMPLERATE, CONFIG.render.TARGET_FPS, CONFIG.render.MIN_FPS, CONFIG.render.FLUSH_BUDGET)
+    scheduler.recorder = recorder
+    # silent windows skip the FFT, a long silence switches to the idle mode
+    gate = SilenceGate(
+        CONFIG.threshold.SILENCE_RMS, CONFIG.threshold.SILENCE_PEAK,
+        CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE.total_seconds())
+    # the analyzed frames are also streamed to the local subscribers
+    publisher = None
+    if publish_path:
+        publisher = BandPublisher(publish_path, CONFIG.publish.MAX_PENDING)
+        if await publisher.start():
+            scheduler.publisher = publisher
+    render_task = asyncio.create_task(scheduler.run())
+    watch_task = None
+    try:
+        if analysis_process:
+            analysis = AnalysisProcess(chunk_size, hop_size or chunk_size, CONFIG.analysis.WORKER_SLOTS, fft_backend)
+            analysis.start()
+            try:
+                watch_task = asyncio.create_task(_watch_config(scheduler, gate, analysis))
+                await _analyze_in_process(devices, scheduler, gate, analysis, chunk_size, hop_size, backend)
+            finally:
+                analysis.stop()
+        else:
+            stages = AnalysisStages(chunk_size, hop_size or chunk_size, fft_backend)
+            watch_task = asyncio.create_task(_watch_config(scheduler, gate, stages))
+            await _analyze(devices, scheduler, gate, stages, chunk_size, hop_size, backend)
+    finally:
+        render_task.cancel()
+        if watch_task is not None:
+            watch_task.cancel()
+        if publisher is not None:
+            await publisher.stop()
+
+async def _watch_config(scheduler: FrameScheduler, gate: SilenceGate, analysis: AnalysisStages | AnalysisProcess):
+    """
+    Reloads the config file when it changes. Runs on the event loop like the analysis and the render loop,
+    so the rebuilt structures are swapped in between frames.
+    """
+    watcher = ConfigWatcher(config_file_path())
+    # the worker gets the sections last, once everything here is rebuilt: a rejected config never reaches it
+    local_analysis = analysis if isinstance(analysis, AnalysisStages) else None
+    while True:
+        await asyncio.sleep(watcher.interval)
+        watcher.poll(
+            lambda changed: _apply_config_changes(scheduler, gate, analysis, changed),
+            lambda changed: _apply_config_changes(scheduler, gate, local_analysis, changed))
 
-    # Apply psychoacoustic weights to the input data
-    weighted_rms = bands_rms * np.array(PSYCHOACOUSTIC_WEIGHTS)
+def _apply_config_changes(
+        scheduler: FrameScheduler, gate: SilenceGate, analysis: AnalysisStages | AnalysisProcess | None,
+        changed: list[str]):
+    """ rebuilds what depends on the reloaded sections (raises -> the previous config is restored), `analysis` last """
+    if "render" in changed:
+        scheduler.configure(CONFIG.render.TARGET_FPS, CONFIG.render.MIN_FPS, CONFIG.render.FLUSH_BUDGET)
+    elif "ema" in changed or "beat" in changed:
+        # the side buttons smoothing and the beat flash fade of the current rate
+        scheduler.set_fps(scheduler.fps)
+    if {"pads", "colors", "threshold"} & set(changed):
+        rebuild_layout()
+    if "threshold" in changed:
+        gate.rms_threshold = CONFIG.threshold.SILENCE_RMS
+        gate.peak_threshold = CONFIG.threshold.SILENCE_PEAK
+        gate.idle_after = CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE.total_seconds()
+    if analysis is not None:
+        analysis.reconfigure(changed)
 
-    # Update EMA with weighted values
-    for i, rms_val in enumerate(weighted_rms):
-        CONFIG.bands.FAST[i] = fast_ema * rms_val + (1 - fast_ema) * CONFIG.bands.FAST[i]
-        CONFIG.bands.SLOW[i] = slow_ema * rms_val + (1 - slow_ema) * CONFIG.bands.SLOW[i]
+async def _analyze(
+        devices: list[LaunchpadDevice], scheduler: FrameScheduler, gate: SilenceGate, stages: AnalysisStages,
+        chunk_size: int, hop_size: int | None, backend: CaptureBackend | None):
+    async for chunk in capture_audio(chunk_size, hop_size, backend):
+        if not(len(chunk) < chunk_size * CONFIG.audio.CHANNELS):
+            if not _gate_window(devices, scheduler, gate, chunk, [stages]):
+                continue
 
-    # Vectorized normalization
-    fast_arr = np.array(CONFIG.bands.FAST)
-    slow_arr = np.array(CONFIG.bands.SLOW)
+            # the audio-to-light latency is counted from here to the MIDI write
+            t_audio = time.perf_counter_ns()
+            bands_rms = process_audio_chunk(chunk, stages.analyzer)
+            t_fft = time.perf_counter_ns()
+            METRICS.record("fft", t_fft - t_audio)
+            beat = detect_beat(stages.onsets)
+            t_onset = time.perf_counter_ns()
+            METRICS.record("onset", t_onset - t_fft)
+            normalized_bands = normalize_bands(bands_rms)
+            METRICS.record("normalize", time.perf_counter_ns() - t_onset)
+            scheduler.publish(normalized_bands, t_audio, beat, stages.balance())
 
-    # Protection from division by zero + normalization
-    ratio = np.where(slow_arr < 1e-6, 0.0, fast_arr / slow_arr)
-    brightness = np.tanh(ratio)
+async def _analyze_in_process(
+        devices: list[LaunchpadDevice], scheduler: FrameScheduler, gate: SilenceGate, analysis: AnalysisProcess,
+        chunk_size: int, hop_size: int | None, backend: CaptureBackend | None):
+    """ the windows are analyzed by the worker process, the results are handled in order as they come back """
+    async for chunk in capture_audio(chunk_size, hop_size, backend):
+        if not(len(chunk) < chunk_size * CONFIG.audio.CHANNELS):
+            if not _gate_window(devices, scheduler, gate, chunk, [analysis]):
+                if gate.changed and gate.idle:
+                    # the windows analyzed before the silence must not show up when the signal is back
+                    await analysis.discard()
+                continue
 
-    # Hard threshold for noise
-    brightness[brightness < 0.08] = 0.0
+            # every slot is busy -> the worker is behind, wait for the oldest window
+            if analysis.full:
+                _handle_result(scheduler, await analysis.result())
+            analysis.submit(chunk, time.perf_counter_ns())
 
-    # Simple smoothing of adjacent bands
-    if len(brightness) > 2:
-        smoothed = brightness
-        smoothed[1:-1] = 0.5 * brightness[1:-1] + 0.25 * (brightness[:-2] + brightness[2:])
+            while analysis.ready():
+                _handle_result(scheduler, await analysis.result())
 
-    return brightness
+    # the stream ended, the windows still in flight are handled too
+    while analysis.in_flight:
+        _handle_result(scheduler, await analysis.result())
 
-async def play_and_visualize(lp, chunk_size: int = 1024, hanning_window: np.ndarray = np.hanning(1024)):
-    global CONFIG, STATE_RESETTED, GLOBAL_PAUSE_START_TIME
+def _handle_result(scheduler: FrameScheduler, result):
+    METRICS.record("fft", result.fft_ns)
+    METRICS.record("onset", result.onset_ns)
+    if result.bands is not None:
+        METRICS.record("normalize", result.normalize_ns)
+        scheduler.publish(result.bands, result.timestamp, result.beat, result.balance)
 
-    async for i, audio_b in aenumerate(capture_audio(chunk_size)):
-        chunk = handle_chunk(audio_b)
-        if not(len(chunk) < chunk_size * CONFIG.audio.CHANNELS):
-            if i % 2 == 0:
-                bands_rms = process_audio_chunk(
-                    chunk, CONFIG.audio.SAMPLERATE, CONFIG.audio.CHANNELS, chunk_size, hanning_window,
-                    CONFIG.bands.RANGE
-                )
-                if np.any(bands_rms):
-                    normalized_bands = normalize_bands(bands_rms)
-                    await visualize_audio_bands(lp, normalized_bands)
-                    # if the state was resetted, set it to False one time
-                    if STATE_RESETTED is not False:
-                        STATE_RESETTED = False
-
-                    # Reset the pause timer, since the signal is back
-                    if GLOBAL_PAUSE_START_TIME is not None:
-                        GLOBAL_PAUSE_START_TIME = None
-                else:
-                    # No signal, start or continue the pause countdown
-                    if GLOBAL_PAUSE_START_TIME is None:
-                        # First moment of silence, start the timer
-                        GLOBAL_PAUSE_START_TIME = datetime.now()
-                        logger.info(f"Signal lost. Starting {CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE.total_seconds()} second countdown to reset.")
-
-                    # Check if the pause threshold has been exceeded
-                    if (datetime.now() - GLOBAL_PAUSE_START_TIME) >= CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE:
-                        # If the state is not already resetted, reset it now
-                        if not STATE_RESETTED:
-                            logger.info(f"{CONFIG.threshold.PAUSE_THRESHOLD_TO_RESET_STATE.total_seconds()} second pause detected. Resetting state...")
-                            reset_state()
-                            await visualize_audio_bands(lp, [0.0] * len(CONFIG.bands.RANGE))
-                            lp.Reset()
-                            logger.info("State resetted.")
-                            STATE_RESETTED = True
-                        else:
-                            # State is already resetted, wait for the new input signal
-                            await asyncio.sleep(0.01)
-                    else:
-                        # Still in the second pause, just wait
-                        await asyncio.sleep(0.01)
+def _gate_window(
+        devices: list[LaunchpadDevice], scheduler: FrameScheduler, gate: SilenceGate,
+        chunk: np.ndarray, stateful: list) -> bool:
+    """
+    True -> the window has a signal and goes to the analysis.
+    Entering the idle mode resets the state, the other pipeline stages (`stateful`, anything with `reset()`)
+    and the devices, then the rendering sleeps until the signal is back.
+    """
+    analyze = gate.process(chunk)
+    if gate.changed:
+        if gate.idle:
+            reset_state()
+            for stage in stateful:
+                stage.reset()
+            scheduler.pause()
+            for device in devices:
+                device.reset()
+            METRICS.count("idle_entered")
+        elif analyze:
+            scheduler.resume()
+    return analyze
 
 def main():
     """
@@ -131,23 +195,75 @@ def main():
     """
     global CONFIG
 
+    setup_session_logging()
+
     parser = argparse.ArgumentParser(description="Audio visualizer launchpad")
     parser.add_argument("-p", "--profiling", action="store_true", help="Enable profiling")
+    parser.add_argument("-d", "--devices", type=int, default=CONFIG.devices.COUNT, help="Number of launchpads to drive")
+    parser.add_argument("-l", "--layout", choices=LAYOUTS, default=CONFIG.devices.LAYOUT, help="mirror - the same bands on every launchpad, span - the bands split across them")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default=CONFIG.audio.BACKEND, help="Audio capture backend")
+    parser.add_argument("-f", "--file", default=CONFIG.audio.INPUT_FILE, help="Audio file for the file backend")
+    parser.add_argument("-m", "--metrics-port", type=int, default=CONFIG.metrics.HTTP_PORT, help="Serve live metrics as JSON on this local port (0 - off)")
+    parser.add_argument("-a", "--analysis-process", action="store_true", default=CONFIG.analysis.WORKER_PROCESS, help="Run the FFT analysis in a separate process")
+    parser.add_argument("-r", "--record", help="Record the rendered band frames and the LED diffs into this directory")
+    parser.add_argument("--replay", help="Replay a recording directory on the launchpads instead of capturing audio")
+    parser.add_argument("--publish", default=CONFIG.publish.SOCKET_PATH, help="Stream the band frames to local subscribers on this Unix socket")
     args = parser.parse_args()
 
-    lp = launchpad.LaunchpadPro()
-    logger.info("Launchpad Pro opened.")
-    logger.debug("Finding opened port...")
-    launchpad_port_index = find_opened_port(lp)
-    logger.debug(f"Result port index: {launchpad_port_index}")
+    logger.debug("Finding opened ports...")
+    # the last known ports first, the port names are listed once (rtmidi), a port scan only without rtmidi
+    port_cache = PortCache(CONFIG.devices.PORT_CACHE)
+    port_cache.load()
+    writers = []
+    if CONFIG.devices.RTMIDI and not CONFIG.devices.PORTS:
+        writers = open_rtmidi_writers(args.devices, port_cache)
+    if writers:
+        outputs = [MidiOutputWorker(None, writer) for writer in writers]
+    else:
+        opened = open_launchpads(args.devices, CONFIG.devices.PORTS, port_cache.launchpad_py)
+        if opened and not CONFIG.devices.PORTS:
+            port_cache.launchpad_py = [port for port, _ in opened]
+            port_cache.save()
+        outputs = [MidiOutputWorker(lp) for _, lp in opened]
+    logger.info(f"{len(outputs)} Launchpad Pro opened.")
 
-    if launchpad_port_index == -1:
+    if not outputs:
         logger.warning("The launchpad port was not found.")
         return
 
     # Reset lights
     logger.info("Resetting lights...")
-    lp.Reset()
+    for output in outputs:
+        output.writer.reset()
+
+    # a grid unplugged and plugged back is reopened in the background
+    monitor = None
+    if writers and CONFIG.devices.HOTPLUG_INTERVAL:
+        monitor = PortMonitor(outputs, CONFIG.devices.HOTPLUG_INTERVAL)
+        monitor.start()
+
+    # bands are computed once and fanned out to every device
+    devices = [LaunchpadDevice(output, name=f"launchpad {i}") for i, output in enumerate(outputs)]
+    recording = Recording(args.replay) if args.replay else None
+    assign_layout(devices, recording.bands_count if recording else len(CONFIG.bands.RANGE), args.layout)
+
+    recorder = None
+    if args.record:
+        recorder = Recorder(
+            args.record, len(CONFIG.bands.RANGE), CONFIG.audio.SAMPLERATE, len(devices),
+            stereo=CONFIG.analysis.STEREO and CONFIG.audio.CHANNELS == 2,
+            layout=args.layout, hop_size=CONFIG.audio.HOP_SIZE, bands_range=CONFIG.bands.RANGE)
+        recorder.open()
+        for i, device in enumerate(devices):
+            device.output = RecordedOutput(device.output, recorder, i)
+
+    for device in devices:
+        device.output.start()
+
+    if CONFIG.metrics.SUMMARY_INTERVAL:
+        log_metrics_periodically(CONFIG.metrics.SUMMARY_INTERVAL)
+    if args.metrics_port:
+        serve_metrics(CONFIG.metrics.HTTP_HOST, args.metrics_port)
 
     if args.profiling:
         pr = cProfile.Profile()
@@ -156,7 +272,16 @@ def main():
             logger.info("Profiling enabled.")
             pr.enable()
         logger.info("Starting visualization...")
-        asyncio.run(play_and_visualize(lp, CONFIG.audio.CHUNK_SIZE))
+        if recording is not None:
+            logger.info(f"Replaying {args.replay}: {len(recording)} frames, {recording.duration:.1f} s.")
+            replay(recording, devices)
+        else:
+            # the fastest FFT backend and the largest window within the budget
+            fft_backend, chunk_size = choose_analysis_fft(CONFIG.audio.HOP_SIZE)
+            backend = create_backend(args.backend, args.file)
+            asyncio.run(play_and_visualize(
+                devices, chunk_size, CONFIG.audio.HOP_SIZE, backend, args.analysis_process, recorder,
+                args.publish, fft_backend))
     except KeyboardInterrupt:
         logger.warning("Visualization stopped by user.")
     except Exception as e:
@@ -167,11 +292,18 @@ def main():
             pr.disable()
             stats = pstats.Stats(pr)
             stats.sort_stats("tottime").print_stats(20)
-        try:
-            logger.info("Resetting lights...")
-            lp.Reset()
-        except Exception as e:
-            logger.exception("Launchpad reset failed.")
+        if monitor is not None:
+            monitor.stop()
+        for device in devices:
+            try:
+                logger.info(f"Resetting {device.name} lights...")
+                device.output.stop(reset=True)
+            except Exception as e:
+                logger.exception(f"{device.name} reset failed.")
+            logger.info(f"{device.name} MIDI output: {device.output.frames_written} frames written, {device.output.frames_coalesced} coalesced.")
+        if recorder is not None:
+            recorder.close()
+        HOT_LOGGER.flush()
     logger.info("Visualization stopped.")
 
 
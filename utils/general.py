@@ -1,10 +1,44 @@
 from launchpad_py import launchpad
 from utils.logger import logger
 
-def find_opened_port(lp: launchpad.LaunchpadPro, ports: int = 256):
-    for i in range(ports):
+def find_opened_port(lp: launchpad.LaunchpadPro, ports: int = 256, start: int = 0):
+    for i in range(start, ports):
         if lp.Open(i):
             logger.info(f"The launchpad port was found in the range of ports: {ports}, port index: {i}")
             return i
     logger.warning(f"The launchpad port was not found in the range of ports: {ports}")
-    return -1
\ No newline at end of file
+    return -1
+
+def open_launchpads(
+        count: int = 1, ports: tuple[int, ...] = (), cached: list[int] = ()) -> list[tuple[int, launchpad.LaunchpadPro]]:
+    """
+    opens the launchpads on the given port numbers, or on the cached ones and then searches for the rest
+    (each after the previous one). Returns (port, launchpad) pairs.
+    """
+    opened = []
+    if ports:
+        for port in ports:
+            lp = launchpad.LaunchpadPro()
+            if lp.Open(port):
+                opened.append((port, lp))
+            else:
+                logger.warning(f"The launchpad port {port} can't be opened.")
+        return opened
+
+    for port in cached[:count]:
+        lp = launchpad.LaunchpadPro()
+        if lp.Open(port):
+            opened.append((port, lp))
+
+    port = opened[-1][0] if opened else -1
+    while len(opened) < count:
+        lp = launchpad.LaunchpadPro()
+        port = find_opened_port(lp, start=port + 1)
+        if port == -1:
+            break
+        opened.append((port, lp))
+    return opened
+
+def hop_alpha(alpha: float, hop: int, reference_hop: int) -> float:
+    """ rescales EMA smoothing tuned for one update per `reference_hop` frames to one update per `hop` frames """
+    return 1.0 - (1.0 - alpha) ** (hop / reference_hop)
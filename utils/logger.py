@@ -1,15 +1,22 @@
 import os
+import sys
+import threading
+import time
 from datetime import datetime
 from loguru import logger
 
 LOGS_DIR = os.path.join('logs')
 
-os.makedirs(LOGS_DIR, exist_ok=True)
 LOG_NAME = f"{datetime.now().date()}.log"
 LOG_FPATH = os.path.join(LOGS_DIR, LOG_NAME)
 
 FILE_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level:<8} | {name}:{line} - {message}\n"
 
+# the sinks write (and rotate/compress) from a background thread, a log call only puts the record into a queue
+ENQUEUE = True
+# hot path messages: one record per message key in this many seconds, the rest are counted
+RATE_LIMIT_INTERVAL = 60.0
+
 def file_format(record):
     return FILE_FORMAT.format(
         time=record["time"],
@@ -19,25 +26,90 @@ def file_format(record):
         message=record["message"]
     )
 
-def add_file_logging(level='DEBUG', rotation='10 MB', compression='zip'):
+def add_console_logging(level='DEBUG', enqueue=ENQUEUE):
+    # replaces the loguru default (synchronous) stderr sink, same format
+    logger.remove()
+    logger.add(sys.stderr, level=level, enqueue=enqueue)
+
+def add_file_logging(level='DEBUG', rotation='10 MB', compression='zip', enqueue=ENQUEUE):
+    os.makedirs(LOGS_DIR, exist_ok=True)
     logger.add(
         sink=LOG_FPATH,
         level=level,
         rotation=rotation,
         compression=compression,
-        format=file_format
+        format=file_format,
+        enqueue=enqueue,
     )
 
 def log_start():
     logger.info("\n------------------- START NEW SESSION -------------------")
 
-add_file_logging()
-# add_console_logging()
-log_start()
+def setup_session_logging():
+    """ file sink and the session banner, called once by the entry point (the spawned processes log to the console) """
+    add_file_logging()
+    log_start()
+
+
+class RateLimitedLogger:
+    """
+    Logging for the real-time loop: a message key is written at most once per `interval` seconds,
+    the suppressed records are only counted and the next written one tells how many there were
+    ("Signal lost. (40x in the last 60 s)"). The message is formatted (lazily, loguru `{}` style)
+    only when it is written.
+    """
+
+    def __init__(self, interval: float = RATE_LIMIT_INTERVAL):
+        self.interval = interval
+        # key -> [last written (monotonic), suppressed since]
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def log(self, level: str, key: str, message: str, *args, exception: bool = False, **kwargs):
+        """ `exception` -> with the traceback of the exception being handled """
+        self._log(level, key, message, args, kwargs, exception)
+
+    def info(self, key: str, message: str, *args, **kwargs):
+        self._log("INFO", key, message, args, kwargs)
+
+    def warning(self, key: str, message: str, *args, **kwargs):
+        self._log("WARNING", key, message, args, kwargs)
+
+    def _log(self, level: str, key: str, message: str, args, kwargs, exception: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is not None and now - state[0] < self.interval:
+                state[1] += 1
+                return
+            suppressed = state[1] if state is not None else 0
+            self._keys[key] = [now, 0]
+
+        if suppressed:
+            message = f"{message} ({suppressed + 1}x in the last {now - state[0]:.3g} s)"
+        # depth 2 -> the record points to the caller of info/warning/log
+        logger.opt(depth=2, exception=exception).log(level, message, *args, **kwargs)
+
+    def flush(self):
+        """ writes the counts of the records suppressed since the last written ones (e.g. at shutdown) """
+        now = time.monotonic()
+        with self._lock:
+            pending = [(key, state[1], now - state[0]) for key, state in self._keys.items() if state[1]]
+            self._keys.clear()
+        for key, suppressed, seconds in pending:
+            logger.info("{}: {}x more in the last {:.3g} s", key, suppressed, seconds)
+
+
+# the real-time loop logs through it
+HOT_LOGGER = RateLimitedLogger()
+
+# the spawned processes (analysis worker) import this module again, the file sink is added by the entry point
+add_console_logging()
 
 if __name__ == "__main__":
+    setup_session_logging()
     logger.debug("Debug message")
     logger.info("Info message")
     logger.warning("Warning message")
     logger.error("Error message")
-    logger.critical("Critical message")
\ No newline at end of file
+    logger.critical("Critical message")
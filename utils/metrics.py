@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from utils.logger import logger
+
+# 4 buckets per power of two (<= 25% bucket width), 64 octaves cover any ns value
+SUB_BUCKETS_BITS = 2
+BUCKETS = 64 << SUB_BUCKETS_BITS
+
+# pipeline stages in the order they run
+STAGES = ("capture", "fft", "onset", "normalize", "render", "midi", "latency")
+
+
+def _bucket(ns: int) -> int:
+    """ small values map 1:1, then the bit length + the next SUB_BUCKETS_BITS bits after the leading one """
+    bits = ns.bit_length()
+    if bits <= SUB_BUCKETS_BITS + 1:
+        return ns
+    shift = bits - 1 - SUB_BUCKETS_BITS
+    return (bits - SUB_BUCKETS_BITS) << SUB_BUCKETS_BITS | (ns >> shift) & ((1 << SUB_BUCKETS_BITS) - 1)
+
+
+def _bucket_upper(index: int) -> int:
+    """ the largest value (ns) of the bucket """
+    if index < 1 << (SUB_BUCKETS_BITS + 1):
+        return index
+    bits = (index >> SUB_BUCKETS_BITS) + SUB_BUCKETS_BITS
+    shift = bits - 1 - SUB_BUCKETS_BITS
+    lower = (1 << SUB_BUCKETS_BITS | index & ((1 << SUB_BUCKETS_BITS) - 1)) << shift
+    return lower + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """ fixed-size log-bucketed histogram of durations (ns), recording is O(1) without allocations """
+
+    def __init__(self):
+        self.counts = np.zeros(BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int):
+        self.counts[_bucket(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, percent: float) -> int:
+        """ approximated percentile (ns), the upper bound of the bucket """
+        if not self.count:
+            return 0
+        index = int(np.searchsorted(np.cumsum(self.counts), self.count * percent / 100.0))
+        return min(_bucket_upper(index), self.max_ns)
+
+    def summary(self) -> dict:
+        """ p50/p95/p99/max/mean in microseconds """
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "p50_us": self.percentile(50) / 1e3,
+            "p95_us": self.percentile(95) / 1e3,
+            "p99_us": self.percentile(99) / 1e3,
+            "max_us": self.max_ns / 1e3,
+            "mean_us": self.total_ns / self.count / 1e3,
+        }
+
+    def reset(self):
+        self.counts.fill(0)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+class Metrics:
+    """
+    Always-on pipeline metrics: a latency histogram per stage and counters.
+    Histograms are collected per summary window (`rotate()`), counters are totals since the start.
+    The MIDI output threads and the event loop write them, every access takes the lock (uncontended, ~100 ns).
+    """
+
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.counters = {}
+        self.started = time.monotonic()
+        self.last_window = {}
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, ns: int):
+        with self._lock:
+            self.stages[stage].record(ns)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def rotate(self) -> dict:
+        """ closes the current window: stores and returns its summary, resets the histograms """
+        now = time.monotonic()
+        with self._lock:
+            self.last_window = {
+                "seconds": now - self._window_started,
+                "stages": {name: hist.summary() for name, hist in self.stages.items()},
+            }
+            for hist in self.stages.values():
+                hist.reset()
+            self._window_started = now
+            return self.last_window
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime": time.monotonic() - self.started,
+                "counters": dict(self.counters),
+                "window": self.last_window,
+            }
+
+    def format_window(self, window: dict) -> str:
+        parts = []
+        for name, stats in window["stages"].items():
+            if stats["count"]:
+                parts.append(f"{name} p50={stats['p50_us']:.0f}us p99={stats['p99_us']:.0f}us max={stats['max_us']:.0f}us")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        counters = ", ".join(f"{name}={value}" for name, value in counters)
+        return f"{window['seconds']:.0f}s: " + "; ".join(parts) + (f" | {counters}" if counters else "")
+
+
+METRICS = Metrics()
+
+
+def log_metrics_periodically(interval: float):
+    """ daemon thread which logs the metrics summary every `interval` seconds """
+    def run():
+        while True:
+            time.sleep(interval)
+            logger.info(f"Metrics {METRICS.format_window(METRICS.rotate())}")
+
+    thread = threading.Thread(target=run, name="metrics-log", daemon=True)
+    thread.start()
+    return thread
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = json.dumps(METRICS.snapshot()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(host: str, port: int) -> ThreadingHTTPServer:
+    """ serves METRICS as JSON on http://host:port/metrics from a daemon thread """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+    return server